@@ -80,6 +80,8 @@ float pixelsPerSecond = 80.0; // Adjust this number to make the shark faster or
 
 unsigned long lastAnimUpdate = 0;
 unsigned long lastNFCScan = 0;
+unsigned long lastHeartbeat = 0;
+const unsigned long HEARTBEAT_INTERVAL_MS = 60000; // keep well under the server's DEVICE_OFFLINE_AFTER
 bool isFrame1 = true;
 int frameCounter = 0;
 
@@ -292,6 +294,27 @@ int sendTagEvent(const uint8_t* uid, uint8_t uidLength, String &firstName, int &
   return httpCode; 
 }
 
+// Tells the server this reader is alive even when nobody taps.
+// The endpoint is derived from API_ENDPOINT (.../api/nfc-events -> .../api/devices/heartbeat).
+void sendHeartbeat() {
+  if (WiFi.status() != WL_CONNECTED) return;
+
+  String url = String(API_ENDPOINT);
+  url.replace("/nfc-events", "/devices/heartbeat");
+
+  StaticJsonDocument<64> doc;
+  doc["device_id"] = DEVICE_ID;
+  String body;
+  serializeJson(doc, body);
+
+  HTTPClient http;
+  http.begin(url);
+  http.addHeader("Content-Type", "application/json");
+  http.setTimeout(2000);
+  http.POST(body);
+  http.end();
+}
+
 void enterMaintenanceMode() {
   maintenanceMode = true;
   Serial.println("ENTERING MAINTENANCE MODE");
@@ -572,6 +595,12 @@ void loop() {
         handleCardFound(uid, uidLength);
     }
   }
+
+  // --- 3. HEARTBEAT ---
+  if (millis() - lastHeartbeat >= HEARTBEAT_INTERVAL_MS) {
+    lastHeartbeat = millis();
+    sendHeartbeat();
+  }
 }
 
 
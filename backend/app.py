@@ -1,26 +1,59 @@
 import os
-import queue
 from flask import Flask
 from flask_cors import CORS
 from pymongo import MongoClient
 from dotenv import load_dotenv
+import cache
+import daily_stats
+import debounce
+import indexes
+import leaderboard
+import presence
+import response_cache
+import schedule
+import scheduler
+import tap_stream
+import tap_worker
+import tap_writer
 
 load_dotenv()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'sharkbyte-hackathon-secret-2025')
-CORS(app, origins=['http://localhost:5173', 'http://10.70.159.4:5173', 'https://10.70.159.4:5173', 'https://sharkbyte.londonrobotics.co.uk'])
+CORS_ORIGINS = ['http://localhost:5173', 'http://10.70.159.4:5173', 'https://10.70.159.4:5173', 'https://sharkbyte.londonrobotics.co.uk']
+CORS(app, origins=CORS_ORIGINS, expose_headers=['X-Next-Cursor'])
 
 # MongoDB
 mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
 mongo_client = MongoClient(mongo_uri)
-db = mongo_client['unitap']
+db = mongo_client[os.getenv('MONGO_DB', 'unitap')]
 
-# Auto-expire pending OTP verifications after 10 minutes
-db.pending_verifications.create_index("created_at", expireAfterSeconds=600)
+# Indexes for every route's query shapes (see indexes.py), built in the background
+indexes.start(db)
 
-# SSE: shared queue for broadcasting tap events to all connected clients
-sse_clients: list[queue.Queue] = []
+# Optional group commit for tap_events inserts (TAP_WRITE_BEHIND=1)
+tap_writer.start(db)
+
+# SSE: live tap events fanned out to every worker through a capped collection
+tap_stream.start(db)
+
+# Live all-time leaderboard kept in memory from the tap stream
+leaderboard.start(db)
+
+# Deferred XP / streak / badge updates
+tap_worker.start(db)
+
+# Coalesced device last_seen writes + offline sweep
+presence.start(db)
+
+# Per-day tap counters for /api/stats
+daily_stats.start(db)
+
+# In-memory lecture timetable for time-based tap resolution
+schedule.start(db)
+
+# Timetable-driven device → lecture assignment
+scheduler.start(db)
 
 # Register blueprints
 from routes.auth import auth_bp
@@ -47,5 +80,24 @@ def health():
     return {'status': 'ok'}
 
 
+@app.route('/api/metrics')
+def metrics():
+    """In-process counters for this worker (cache hit rates etc.)."""
+    return {
+        'pid': os.getpid(),
+        'tap_cache': cache.stats(),
+        'tap_worker': tap_worker.stats(),
+        'presence': presence.stats(),
+        'tap_debounce': debounce.stats(),
+        'tap_writer': tap_writer.stats(),
+        'daily_stats': daily_stats.stats(),
+        'response_cache': response_cache.stats(),
+        'schedule': schedule.stats(),
+        'scheduler': scheduler.stats(),
+        'tap_stream': tap_stream.stats(),
+        'leaderboard': leaderboard.stats(),
+    }
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=True, threaded=True)
@@ -0,0 +1,204 @@
+"""ASGI entry point: SSE streams on an event loop, everything else on Flask.
+
+Under gthread, each open EventSource held one of the worker's threads for as
+long as it stayed open. With 2 workers x 4 threads, eight dashboards were
+enough to leave tap POSTs waiting. Here the stream endpoints are plain
+coroutines, so one event loop holds thousands of idle connections. All other
+requests go to the Flask app through a2wsgi, on its own thread pool of
+WSGI_THREADS threads, which stream listeners never occupy.
+
+    uvicorn asgi:app --workers 2 --host 0.0.0.0 --port 5000
+
+app.py still serves the /api/stream/* endpoints itself for `python app.py` in development.
+"""
+
+import asyncio
+import os
+import threading
+from urllib.parse import parse_qsl
+from a2wsgi import WSGIMiddleware
+import leaderboard
+import tap_stream
+from app import app as flask_app, CORS_ORIGINS
+
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', '16'))
+KEEPALIVE_INTERVAL = 30
+
+KEEPALIVE = b': keepalive\n\n'
+
+
+class AsyncSubscriber(tap_stream.Subscriber):
+    """A Subscriber read from an event loop. The tap_stream reader thread
+    offers frames; they are handed to the loop without blocking it.
+    """
+
+    def __init__(self, loop, maxsize=tap_stream.TAP_STREAM_QUEUE):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.closed = False
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    def push(self, frame):
+        with self._lock:
+            if frame is not None and self._depth >= self.maxsize:
+                return False
+            self._depth += 1
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, frame)
+        except RuntimeError:
+            # The loop has shut down; the stream is gone anyway
+            return False
+        return True
+
+    def close(self):
+        self.closed = True
+        self.push(None)
+
+    async def get_async(self, timeout):
+        """Next frame, None once closed. Raises asyncio.TimeoutError after timeout."""
+        if self.closed:
+            return None
+        frame = await asyncio.wait_for(self.queue.get(), timeout)
+        with self._lock:
+            self._depth -= 1
+        return frame
+
+    def depth(self):
+        return self._depth
+
+
+class AsyncTickSubscriber(tap_stream.TickSubscriber):
+    """A TickSubscriber read from an event loop."""
+
+    def __init__(self, loop, tick):
+        super().__init__(tick)
+        self.loop = loop
+        self.ready = asyncio.Event()
+
+    def _wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:
+            pass
+
+    def offer(self, event):
+        if self.batch.add(event):
+            self._wake()
+        return True
+
+    def push(self, frame):
+        if self.batch.mark_resync():
+            self._wake()
+        return True
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    async def get_async(self, timeout):
+        while True:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+            if self.closed:
+                return None
+            await asyncio.sleep(self.tick)
+            self.ready.clear()
+            frame = self.batch.take()
+            if frame is not None:
+                return frame
+
+
+def _cors_headers(scope):
+    origin = dict(scope['headers']).get(b'origin', b'').decode()
+    if origin in CORS_ORIGINS:
+        return [(b'access-control-allow-origin', origin.encode()), (b'vary', b'Origin')]
+    return []
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def sse(scope, receive, send, channel, subscriber):
+    """Stream a subscriber's frames until the client goes away or is evicted."""
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            *_cors_headers(scope),
+        ],
+    })
+    gone = asyncio.ensure_future(_disconnected(receive))
+    try:
+        while True:
+            frame = asyncio.ensure_future(subscriber.get_async(KEEPALIVE_INTERVAL))
+            done, _ = await asyncio.wait({frame, gone}, return_when=asyncio.FIRST_COMPLETED)
+            if gone in done:
+                frame.cancel()
+                return
+            try:
+                body = frame.result()
+            except asyncio.TimeoutError:
+                body = KEEPALIVE
+            if body is None:
+                # Evicted as a slow consumer; the browser reconnects and catches up
+                break
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        gone.cancel()
+        channel.unsubscribe(subscriber)
+
+
+async def tap_stream_endpoint(scope, receive, send):
+    last_event_id = dict(scope['headers']).get(b'last-event-id', b'').decode() or None
+    params = dict(parse_qsl(scope['query_string'].decode()))
+    loop = asyncio.get_running_loop()
+    tick = tap_stream.tick_interval(params)
+    subscriber = tap_stream.taps.subscribe(
+        last_event_id,
+        subscriber=AsyncTickSubscriber(loop, tick) if tick else AsyncSubscriber(loop),
+        filters=tap_stream.parse_filters(params),
+    )
+    await sse(scope, receive, send, tap_stream.taps, subscriber)
+
+
+async def leaderboard_endpoint(scope, receive, send):
+    last_event_id = dict(scope['headers']).get(b'last-event-id', b'').decode() or None
+    channel = leaderboard.channel
+    subscriber = channel.subscribe(last_event_id, subscriber=AsyncSubscriber(asyncio.get_running_loop()))
+    await sse(scope, receive, send, channel, subscriber)
+
+
+STREAMS = {
+    '/api/stream/taps': tap_stream_endpoint,
+    '/api/stream/leaderboard': leaderboard_endpoint,
+}
+
+wsgi = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+
+
+async def lifespan(receive, send):
+    # Background threads start when app.py is imported; nothing to do here
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'] in STREAMS:
+        await STREAMS[scope['path']](scope, receive, send)
+    else:
+        await wsgi(scope, receive, send)
@@ -0,0 +1,174 @@
+"""Benchmark the tap hot path against a local MongoDB.
+
+Counts the MongoDB commands (round trips) each tap issues and times it:
+
+    python bench.py                      # 500 taps per action
+    python bench.py --taps 2000
+    python bench.py --max-round-trips 3  # exit 1 if attendance taps need more
+
+Runs against BENCH_DB (default unitap_bench) on MONGO_URI, which is emptied
+and filled with a small fixture first, so it never touches real data.
+Cached lookups expire periodically, so the limit applies to the median tap.
+"""
+
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import threading
+import time
+
+from pymongo import monitoring
+
+BENCH_DB = os.getenv('BENCH_DB', 'unitap_bench')
+
+# Handshake / session bookkeeping is not part of a request's work
+IGNORED_COMMANDS = {'hello', 'isMaster', 'ismaster', 'ping', 'endSessions', 'saslStart', 'saslContinue'}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands started by the thread that last called reset().
+    Listeners run on the thread issuing the command, so background workers
+    (tap worker, presence flusher) do not pollute a request's count.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.count = 0
+        self.names = []
+
+    def reset(self):
+        with self._lock:
+            self._thread = threading.get_ident()
+            self.count = 0
+            self.names = []
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS or threading.get_ident() != self._thread:
+            return
+        # Unacknowledged writes (w=0) never wait for a reply
+        if event.command.get('writeConcern', {}).get('w') == 0:
+            return
+        with self._lock:
+            self.count += 1
+            self.names.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+counter = CommandCounter()
+
+
+def load_app():
+    """Import the Flask app wired to the benchmark database, with the counter registered."""
+    os.environ['MONGO_DB'] = BENCH_DB
+    # The fixture cycles through cards quickly; repeats must not be debounced
+    os.environ['TAP_DEBOUNCE_MS'] = '0'
+    monitoring.register(counter)
+    import app
+    return app
+
+
+def build_fixture(db, users=200):
+    """Empty the benchmark database and create one reader per tap mode."""
+    for col in db.list_collection_names():
+        # tap_stream is capped; its old events are never replayed anyway
+        if col not in ('system.indexes', 'tap_stream'):
+            db[col].delete_many({})
+
+    now = datetime.datetime.utcnow()
+    cards = [f'BENCH{i:05d}' for i in range(users)]
+    db.users.insert_many([
+        {'email': f'bench{i}@kcl.ac.uk', 'name': f'Bench User {i}', 'card_uid': card,
+         'role': 'student', 'university': 'KCL', 'created_at': now}
+        for i, card in enumerate(cards)
+    ])
+
+    lecture_id = db.lectures.insert_one({
+        'name': 'Benchmarking', 'professor': 'Dr. Bench', 'room': 'Bush House 1.01',
+        'start_time': now - datetime.timedelta(minutes=10), 'end_time': now + datetime.timedelta(minutes=50),
+        'device_id': 'BENCH-ATT', 'expected_students': users, 'attendees': [],
+    }).inserted_id
+    society_id = db.societies.insert_one({
+        'name': 'Bench Society', 'lead_id': None, 'admins': [], 'members': [], 'description': '',
+    }).inserted_id
+    event_id = db.events.insert_one({
+        'society_id': society_id, 'name': 'Bench Night', 'description': '', 'location': 'Great Hall',
+        'date': now, 'capacity': 0, 'registered': [], 'checked_in': [], 'device_id': 'BENCH-EVT',
+    }).inserted_id
+
+    db.devices.insert_many([
+        {'device_id': 'BENCH-ATT', 'name': 'Bench attendance', 'location': 'Bush House 1.01',
+         'mode': 'attendance', 'config': {'lecture_id': str(lecture_id)}, 'is_online': True, 'last_seen': now},
+        {'device_id': 'BENCH-EVT', 'name': 'Bench event', 'location': 'Great Hall',
+         'mode': 'event', 'config': {'event_id': str(event_id)}, 'is_online': True, 'last_seen': now},
+    ])
+    return cards
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def bench_taps(client, device_id, cards, taps):
+    """POST taps to /api/nfc-events.
+    Returns (round_trips, latencies_ms, commands), the last being the
+    command names issued by the final tap.
+    """
+    # Warm the caches and connection pool so we measure the steady state
+    client.post('/api/nfc-events', json={'uid': cards[0], 'device_id': device_id})
+
+    round_trips, latencies = [], []
+    for i in range(taps):
+        card = cards[i % len(cards)]
+        counter.reset()
+        start = time.perf_counter()
+        resp = client.post('/api/nfc-events', json={'uid': card, 'device_id': device_id})
+        latencies.append((time.perf_counter() - start) * 1000)
+        round_trips.append(counter.count)
+        if resp.status_code != 201:
+            raise RuntimeError(f'tap failed ({resp.status_code}): {resp.get_json()}')
+    return round_trips, latencies, list(counter.names)
+
+
+def report(label, round_trips, latencies, commands):
+    print(f'{label:<12} taps={len(round_trips):<6} '
+          f'round trips median={statistics.median(round_trips):g} mean={statistics.mean(round_trips):.2f} '
+          f'max={max(round_trips):<3} '
+          f'latency p50={percentile(latencies, 50):.2f}ms p95={percentile(latencies, 95):.2f}ms '
+          f'p99={percentile(latencies, 99):.2f}ms')
+    print(f'{"":<12} commands: {", ".join(commands)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--taps', type=int, default=500, help='taps per reader mode')
+    parser.add_argument('--users', type=int, default=200, help='users in the fixture')
+    parser.add_argument('--max-round-trips', type=int, default=None,
+                        help='fail if the median attendance tap needs more round trips than this')
+    args = parser.parse_args()
+
+    app = load_app()
+    cards = build_fixture(app.db, users=args.users)
+    client = app.app.test_client()
+
+    att_trips, att_latency, att_commands = bench_taps(client, 'BENCH-ATT', cards, args.taps)
+    report('attendance', att_trips, att_latency, att_commands)
+    evt_trips, evt_latency, evt_commands = bench_taps(client, 'BENCH-EVT', cards, args.taps)
+    report('event', evt_trips, evt_latency, evt_commands)
+
+    median = statistics.median(att_trips)
+    if args.max_round_trips is not None and median > args.max_round_trips:
+        print(f'FAIL: attendance taps need {median:g} round trips (limit {args.max_round_trips})')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
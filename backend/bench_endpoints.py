@@ -0,0 +1,321 @@
+"""Benchmark the hot endpoints against generated datasets of several sizes.
+
+For each dataset, every case runs --iterations times after a warm-up. The
+median and p95 latency are recorded, along with the median number of MongoDB
+round trips per call. Results are compared with bench_baselines.json:
+
+    python bench_endpoints.py                       # small + medium, compare to baselines
+    python bench_endpoints.py --sizes small,medium,large
+    python bench_endpoints.py --sizes small --save  # record new baselines
+    python bench_endpoints.py --only leaderboard    # cases whose name contains this
+
+A case regresses when its median latency exceeds its baseline by more than
+--tolerance and also by at least --min-delta-ms. Needing more round trips
+than the baseline is always a regression. Any regression makes the run exit
+with status 1.
+
+Baselines are machine-specific, so bench_baselines.json is not shipped. A
+comparison run fails straight away when a size has no baseline, and fails
+at the end when a case has none. Record them first on the reference machine
+(and commit the file, or keep it there):
+
+    python bench_endpoints.py --sizes small,medium --save
+
+Each size has its own database, BENCH_DB_<size> on MONGO_URI (for example
+unitap_bench_small). It is generated with seed_large.py when it is missing,
+older than --max-age-hours or built with other parameters, and otherwise
+reused. Each size runs in a fresh interpreter so the app and its caches bind
+to that database. The response cache is off, so the cases measure the query
+work and not cache hits. The tap case uses its own users, device and lecture,
+and removes them afterwards.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import bench
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINES_PATH = os.path.join(HERE, 'bench_baselines.json')
+DB_PREFIX = bench.BENCH_DB
+
+# seed_large.py arguments per dataset size
+SIZES = {
+    'small': {'users': 2000, 'lectures': 400, 'events': 100, 'societies': 30, 'rooms': 20, 'taps': 50000},
+    'medium': {'users': 20000, 'lectures': 4000, 'events': 500, 'societies': 100, 'rooms': 60, 'taps': 1000000},
+    'large': {'users': 100000, 'lectures': 20000, 'events': 2000, 'societies': 300, 'rooms': 120, 'taps': 10000000},
+}
+
+BENCH_DEVICE = 'BENCH-EP-ATT'
+BENCH_CARD_PREFIX = 'BENCHEP'
+
+
+def db_name(size):
+    return f'{DB_PREFIX}_{size}'
+
+
+# ─── Datasets ────────────────────────────────────────
+
+def ensure_dataset(size, max_age_hours, reseed=False):
+    """Generate the dataset for size with seed_large.py unless a fresh one exists."""
+    from pymongo import MongoClient
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))[db_name(size)]
+    params = SIZES[size]
+    meta = db.bench_meta.find_one({'_id': 'dataset'})
+    if meta and not reseed and meta['params'] == params:
+        age = datetime.datetime.utcnow() - meta['generated_at']
+        if age < datetime.timedelta(hours=max_age_hours):
+            return
+    print(f'[{size}] generating dataset into {db_name(size)} ...', flush=True)
+    cmd = [sys.executable, os.path.join(HERE, 'seed_large.py'), '--db', db_name(size)]
+    for k, v in params.items():
+        cmd += [f'--{k}', str(v)]
+    subprocess.run(cmd, check=True, cwd=HERE)
+    db.bench_meta.replace_one(
+        {'_id': 'dataset'}, {'params': params, 'generated_at': datetime.datetime.utcnow()}, upsert=True
+    )
+
+
+# ─── Cases (run inside the per-size interpreter) ─────
+
+def measure(call, iterations):
+    """Run call() once to warm up, then iterations times. Returns the case result."""
+    call()
+    latencies, round_trips = [], []
+    for _ in range(iterations):
+        bench.counter.reset()
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+        round_trips.append(bench.counter.count)
+    return {
+        'p50_ms': round(bench.percentile(latencies, 50), 3),
+        'p95_ms': round(bench.percentile(latencies, 95), 3),
+        'round_trips': statistics.median(round_trips),
+        'commands': list(bench.counter.names),
+    }
+
+
+def get(client, path, token=None):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    def call():
+        resp = client.get(path, headers=headers)
+        if resp.status_code != 200:
+            raise RuntimeError(f'GET {path} failed ({resp.status_code}): {resp.get_data(as_text=True)[:200]}')
+    return call
+
+
+def sample_users(db):
+    """A mid-table student for the leaderboard and a society member for my_societies."""
+    students = db.users.count_documents({'role': 'student'})
+    me = next(db.users.find({'role': 'student'}).sort('_id', 1).skip(students // 2).limit(1), None)
+    society = db.societies.find_one({'members.0': {'$exists': True}}, {'members': 1})
+    member = db.users.find_one({'_id': society['members'][0]}) if society else me
+    return me, member
+
+
+def setup_tap_fixture(db, taps):
+    """Bench-only users, reader and live lecture for process_tap_core."""
+    now = datetime.datetime.utcnow()
+    cards = [f'{BENCH_CARD_PREFIX}{i:05d}' for i in range(taps + 1)]
+    db.users.insert_many([
+        {'email': f'bench-ep{i}@kcl.ac.uk', 'name': f'Bench EP {i}', 'card_uid': card,
+         'role': 'student', 'university': 'KCL', 'points': 0, 'created_at': now}
+        for i, card in enumerate(cards)
+    ])
+    lecture_id = db.lectures.insert_one({
+        'name': 'Endpoint Benchmarking', 'professor': 'Dr. Bench', 'room': 'Bench Room',
+        'start_time': now - datetime.timedelta(minutes=10), 'end_time': now + datetime.timedelta(minutes=50),
+        'device_id': BENCH_DEVICE, 'expected_students': taps, 'attendees': [],
+    }).inserted_id
+    db.devices.insert_one({
+        'device_id': BENCH_DEVICE, 'name': 'Endpoint bench reader', 'location': 'Bench Room',
+        'mode': 'attendance', 'config': {'lecture_id': str(lecture_id)}, 'is_online': True, 'last_seen': now,
+    })
+    return cards, lecture_id
+
+
+def cleanup_tap_fixture(app, lecture_id):
+    """Remove everything the tap case wrote and recount today's stats."""
+    import daily_stats
+    import leaderboard
+    db = app.db
+    daily_stats.flush(db)
+    leaderboard.flush(db)
+    user_ids = [u['_id'] for u in db.users.find({'card_uid': {'$regex': f'^{BENCH_CARD_PREFIX}'}}, {'_id': 1})]
+    db.tap_events.delete_many({'device_id': BENCH_DEVICE})
+    db.tap_jobs.delete_many({'user_id': {'$in': user_ids}})
+    db.users.delete_many({'_id': {'$in': user_ids}})
+    db.leaderboard_counts.delete_many({'_id': {'$in': user_ids}})
+    db.lectures.delete_one({'_id': lecture_id})
+    db.devices.delete_one({'device_id': BENCH_DEVICE})
+    daily_stats.rebuild(db, daily_stats.day_key(datetime.datetime.utcnow()))
+    daily_stats.rebuild_totals(db)
+
+
+def run_cases(size, iterations, only):
+    """Benchmark every case against one dataset. Returns {case: result}."""
+    bench.BENCH_DB = db_name(size)
+    os.environ['RESPONSE_CACHE_ENABLED'] = '0'
+    app = bench.load_app()
+    db = app.db
+    client = app.app.test_client()
+
+    from routes.auth import make_token
+    me, member = sample_users(db)
+    with app.app.app_context():
+        me_token = make_token(me)
+        member_token = make_token(member)
+
+    cases = [
+        ('get_stats', get(client, '/api/stats')),
+        ('leaderboard_all', get(client, '/api/gamification/leaderboard?period=all')),
+        ('leaderboard_all_me', get(client, '/api/gamification/leaderboard?period=all', me_token)),
+        ('leaderboard_week', get(client, '/api/gamification/leaderboard?period=week')),
+        ('leaderboard_week_me', get(client, '/api/gamification/leaderboard?period=week', me_token)),
+        ('get_lectures', get(client, '/api/attendance/lectures')),
+        ('get_lectures_live', get(client, '/api/attendance/lectures?status=live')),
+        ('societies_get_all', get(client, '/api/societies')),
+        ('my_societies', get(client, '/api/auth/me/societies', member_token)),
+    ]
+    results = {}
+    for name, call in cases:
+        if only and only not in name:
+            continue
+        results[name] = measure(call, iterations)
+
+    if not only or only in 'process_tap_core':
+        from routes.tap import process_tap_core
+        import schedule
+        cards, lecture_id = setup_tap_fixture(db, iterations)
+        schedule.refresh(db)
+        remaining = iter(cards)
+        try:
+            def tap():
+                with app.app.app_context():
+                    _, status = process_tap_core(BENCH_DEVICE, next(remaining))
+                if status != 201:
+                    raise RuntimeError(f'process_tap_core returned {status}')
+            results['process_tap_core'] = measure(tap, iterations)
+        finally:
+            cleanup_tap_fixture(app, lecture_id)
+    return results
+
+
+# ─── Baselines and reporting ─────────────────────────
+
+def load_baselines():
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH) as f:
+        return json.load(f)
+
+
+def save_baselines(baselines):
+    with open(BASELINES_PATH, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(result, baseline, tolerance, min_delta_ms):
+    """Reasons this result regressed against baseline (empty if it did not)."""
+    if not baseline:
+        return []
+    reasons = []
+    if result['round_trips'] > baseline['round_trips']:
+        reasons.append(f"round trips {baseline['round_trips']:g} -> {result['round_trips']:g}")
+    delta = result['p50_ms'] - baseline['p50_ms']
+    if delta > baseline['p50_ms'] * tolerance and delta >= min_delta_ms:
+        reasons.append(f"p50 {baseline['p50_ms']:.2f}ms -> {result['p50_ms']:.2f}ms")
+    return reasons
+
+
+def report(size, results, baselines, tolerance, min_delta_ms):
+    """Print one size's table. Returns the number of regressions and missing baselines."""
+    print(f'\n[{size}] {db_name(size)}')
+    print(f'{"case":<22}{"p50 ms":>10}{"p95 ms":>10}{"trips":>7}{"base p50":>10}{"base trips":>11}  status')
+    regressions = 0
+    for name, r in results.items():
+        base = baselines.get(size, {}).get(name)
+        reasons = compare(r, base, tolerance, min_delta_ms)
+        if not base:
+            # A case added since the baselines were saved; passing it would hide its regressions
+            regressions += 1
+            status = 'MISSING BASELINE (record one with --save)'
+        else:
+            regressions += bool(reasons)
+            status = 'REGRESSION: ' + '; '.join(reasons) if reasons else 'ok'
+        print(f'{name:<22}{r["p50_ms"]:>10.2f}{r["p95_ms"]:>10.2f}{r["round_trips"]:>7g}'
+              f'{(base or {}).get("p50_ms", float("nan")):>10.2f}{(base or {}).get("round_trips", float("nan")):>11g}'
+              f'  {status}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='small,medium', help=f'comma-separated, from {", ".join(SIZES)}')
+    parser.add_argument('--iterations', type=int, default=30, help='timed calls per case')
+    parser.add_argument('--only', default='', help='run only cases whose name contains this')
+    parser.add_argument('--save', action='store_true', help='store this run as the new baselines')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative p50 slowdown')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='ignore p50 slowdowns smaller than this')
+    parser.add_argument('--reseed', action='store_true', help='regenerate datasets even if fresh')
+    parser.add_argument('--max-age-hours', type=float, default=24,
+                        help='regenerate datasets older than this, so "this week" still has data')
+    parser.add_argument('--run-size', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size:
+        # Child: one dataset, results to --out
+        results = run_cases(args.run_size, args.iterations, args.only)
+        with open(args.out, 'w') as f:
+            json.dump(results, f)
+        return
+
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f'unknown size(s): {", ".join(unknown)}')
+
+    baselines = load_baselines()
+    missing = [s for s in sizes if s not in baselines]
+    if missing and not args.save:
+        sys.exit(f'no baselines for {", ".join(missing)} in {BASELINES_PATH}; record them first with '
+                 f'python bench_endpoints.py --sizes {",".join(missing)} --save')
+    regressions = 0
+    for size in sizes:
+        ensure_dataset(size, args.max_age_hours, args.reseed)
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+            out = tmp.name
+        try:
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--run-size', size, '--out', out,
+                            '--iterations', str(args.iterations), '--only', args.only], check=True, cwd=HERE)
+            with open(out) as f:
+                results = json.load(f)
+        finally:
+            os.unlink(out)
+        regressions += report(size, results, baselines, args.tolerance, args.min_delta_ms)
+        if args.save:
+            baselines.setdefault(size, {}).update(
+                {name: {k: r[k] for k in ('p50_ms', 'p95_ms', 'round_trips')} for name, r in results.items()}
+            )
+
+    if args.save:
+        save_baselines(baselines)
+        print(f'\nbaselines saved to {BASELINES_PATH}')
+    elif regressions:
+        print(f'\nFAIL: {regressions} regression(s) or missing baseline(s)')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
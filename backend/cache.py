@@ -0,0 +1,105 @@
+"""In-process read-through caches for the tap hot path.
+
+Card → user and device_id → device lookups run on every tap but change
+rarely, so each worker keeps a small LRU with a TTL in front of them.
+Writes in this process invalidate the affected keys immediately; other
+gunicorn workers pick the change up when their entry expires (TAP_CACHE_TTL).
+Misses are never cached, so a newly linked card or registered device works
+on its first tap.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+TAP_CACHE_SIZE = int(os.getenv('TAP_CACHE_SIZE', '10000'))
+TAP_CACHE_TTL = float(os.getenv('TAP_CACHE_TTL', '30'))
+
+# Only the fields the tap path needs. points is just the starting value for
+# provisional points; gamification state itself is never read from here.
+USER_FIELDS = {'name': 1, 'card_uid': 1, 'points': 1}
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value, or None on a miss or expired entry."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+users_by_card = TTLCache(TAP_CACHE_SIZE, TAP_CACHE_TTL)
+devices_by_id = TTLCache(TAP_CACHE_SIZE, TAP_CACHE_TTL)
+
+
+def get_user_by_card(db, card_uid):
+    """Return {_id, name, card_uid, points} for a linked card, or None."""
+    user = users_by_card.get(card_uid)
+    if user is None:
+        user = db.users.find_one({'card_uid': card_uid}, USER_FIELDS)
+        if user:
+            users_by_card.set(card_uid, user)
+    return user
+
+
+def get_device(db, device_id):
+    """Return the device document for a device_id, or None."""
+    device = devices_by_id.get(device_id)
+    if device is None:
+        device = db.devices.find_one({'device_id': device_id})
+        if device:
+            devices_by_id.set(device_id, device)
+    return device
+
+
+def stats():
+    return {
+        'users_by_card': users_by_card.stats(),
+        'devices_by_id': devices_by_id.stats(),
+    }
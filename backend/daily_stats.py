@@ -0,0 +1,252 @@
+"""Per-day tap counters behind /api/stats.
+
+Each UTC day has one ``daily_stats`` document:
+
+    {_id: '2025-02-19', taps: 812, actions: {attendance: 640, ...}, unique_students: 231,
+     lecture_attendees: 402}
+
+lecture_attendees counts the attendees of lectures starting that day. One
+more document, ``{_id: 'totals'}``, holds lecture_attendees over all lectures
+and the equipment queues (``queues: {active, students}``). Expected students
+come from the timetable (schedule.py), not from here.
+
+Stored taps are recorded in memory and a background thread folds them in
+every DAILY_STATS_FLUSH_INTERVAL seconds with one $inc per day, so the tap
+path itself does no extra writes. Unique students are tracked exactly with
+one ``daily_students`` row per (day, user): a flush upserts the rows and
+increments unique_students by the number of rows it actually created, so a
+student counted by another worker is not counted twice. Lecture attendees
+work the same way, with one ``lecture_attendees`` row per (lecture, user).
+Queue totals are recomputed by refresh_queues() whenever a queue changes;
+there are only as many queues as equipment readers.
+
+Counts lag the taps by up to one flush interval, and a crash loses at most
+that interval's taps. ``python daily_stats.py rebuild [YYYY-MM-DD]``
+recomputes a day from tap_events and lectures, and the totals, e.g. after
+seeding or importing data.
+"""
+
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+log = logging.getLogger(__name__)
+
+DAILY_STATS_FLUSH_INTERVAL = float(os.getenv('DAILY_STATS_FLUSH_INTERVAL', '1'))
+
+_lock = threading.Lock()
+_counts = {}      # day -> {action: taps}
+_students = set()  # (day, user_id)
+_attendees = set()  # (day, lecture_id, user_id)
+_thread = None
+_stats = {'recorded': 0, 'flushes': 0, 'new_students': 0, 'new_attendees': 0, 'errors': 0}
+
+TOTALS_ID = 'totals'
+
+
+def day_key(when):
+    return when.strftime('%Y-%m-%d')
+
+
+def record(taps):
+    """Count stored tap events (dicts with user_id, action and timestamp)."""
+    with _lock:
+        for tap in taps:
+            day = day_key(tap['timestamp'])
+            actions = _counts.setdefault(day, {})
+            actions[tap['action']] = actions.get(tap['action'], 0) + 1
+            _students.add((day, tap['user_id']))
+            _stats['recorded'] += 1
+
+
+def record_attendees(lecture, user_ids):
+    """Count users added to a lecture's attendees (lecture needs _id and start_time)."""
+    day = day_key(lecture['start_time'])
+    with _lock:
+        for uid in user_ids:
+            _attendees.add((day, lecture['_id'], uid))
+
+
+def get_day(db, day):
+    """Return the counters for a day (a date/datetime or 'YYYY-MM-DD')."""
+    if not isinstance(day, str):
+        day = day_key(day)
+    return db.daily_stats.find_one({'_id': day}) or {'_id': day, 'taps': 0, 'actions': {}, 'unique_students': 0}
+
+
+def get_totals(db):
+    """Return the all-time lecture attendees and the equipment queue totals."""
+    return db.daily_stats.find_one({'_id': TOTALS_ID}) or {'_id': TOTALS_ID}
+
+
+def _new_rows(collection, rows):
+    """Upsert rows ({_id, day, ...} dicts); returns {day: number of rows created}."""
+    now = datetime.datetime.utcnow()
+    ops = [
+        UpdateOne({'_id': row['_id']}, {'$setOnInsert': {**row, 'created_at': now}}, upsert=True)
+        for row in rows
+    ]
+    try:
+        upserted = collection.bulk_write(ops, ordered=False).upserted_ids
+        indexes = list(upserted)
+    except BulkWriteError as e:
+        # Another worker created the same row at the same moment; it counted it
+        indexes = [u['index'] for u in e.details.get('upserted', [])]
+    created = {}
+    for i in indexes:
+        day = rows[i]['day']
+        created[day] = created.get(day, 0) + 1
+    return created
+
+
+def flush(db):
+    """Fold recorded taps into daily_stats. Returns the number of days written."""
+    global _counts, _students, _attendees
+    with _lock:
+        counts, _counts = _counts, {}
+        students, _students = _students, set()
+        attendees, _attendees = _attendees, set()
+    if not counts and not attendees:
+        return 0
+
+    created = _new_rows(db.daily_students, [
+        {'_id': f'{day}:{uid}', 'day': day, 'user_id': uid} for day, uid in students
+    ]) if students else {}
+    attended = _new_rows(db.lecture_attendees, [
+        {'_id': f'{lecture_id}:{uid}', 'day': day, 'lecture_id': lecture_id, 'user_id': uid}
+        for day, lecture_id, uid in attendees
+    ]) if attendees else {}
+
+    incs = {}
+    for day, actions in counts.items():
+        inc = incs.setdefault(day, {f'actions.{action}': n for action, n in actions.items()})
+        inc['taps'] = sum(actions.values())
+        if created.get(day):
+            inc['unique_students'] = created[day]
+    for day, n in attended.items():
+        incs.setdefault(day, {})['lecture_attendees'] = n
+    if attended:
+        incs[TOTALS_ID] = {'lecture_attendees': sum(attended.values())}
+    ops = [UpdateOne({'_id': day}, {'$inc': inc}, upsert=True) for day, inc in incs.items()]
+    db.daily_stats.bulk_write(ops, ordered=False)
+
+    _stats['flushes'] += 1
+    _stats['new_students'] += sum(created.values())
+    _stats['new_attendees'] += sum(attended.values())
+    return len(ops)
+
+
+def refresh_queues(db):
+    """Recompute the equipment queue totals; call after changing any queue."""
+    queues = list(db.equipment.aggregate([
+        {'$project': {'queued': {'$size': {'$ifNull': ['$queue', []]}}}},
+        {'$group': {
+            '_id': None,
+            'active': {'$sum': {'$cond': [{'$gt': ['$queued', 0]}, 1, 0]}},
+            'students': {'$sum': '$queued'},
+        }},
+    ]))
+    totals = {'active': queues[0]['active'], 'students': queues[0]['students']} if queues else {
+        'active': 0, 'students': 0}
+    db.daily_stats.update_one({'_id': TOTALS_ID}, {'$set': {'queues': totals}}, upsert=True)
+
+
+def rebuild(db, day):
+    """Recompute one day's counters and student and attendee rows from
+    tap_events and that day's lectures.
+    """
+    start = datetime.datetime.strptime(day, '%Y-%m-%d')
+    match = {'timestamp': {'$gte': start, '$lt': start + datetime.timedelta(days=1)}}
+    actions = {r['_id']: r['n'] for r in db.tap_events.aggregate([
+        {'$match': match}, {'$group': {'_id': '$action', 'n': {'$sum': 1}}},
+    ])}
+    user_ids = db.tap_events.distinct('user_id', match)
+
+    now = datetime.datetime.utcnow()
+    db.daily_students.delete_many({'day': day})
+    if user_ids:
+        db.daily_students.insert_many([
+            {'_id': f'{day}:{uid}', 'day': day, 'user_id': uid, 'created_at': now} for uid in user_ids
+        ])
+
+    lecture_match = {'start_time': match['timestamp']}
+    db.lecture_attendees.delete_many({'day': day})
+    rows = [
+        {'_id': f'{l["_id"]}:{uid}', 'day': day, 'lecture_id': l['_id'], 'user_id': uid, 'created_at': now}
+        for l in db.lectures.find(lecture_match, {'attendees': 1}) for uid in l.get('attendees', [])
+    ]
+    if rows:
+        db.lecture_attendees.insert_many(rows, ordered=False)
+    db.daily_stats.replace_one({'_id': day}, {
+        'taps': sum(actions.values()),
+        'actions': actions,
+        'unique_students': len(user_ids),
+        'lecture_attendees': len(rows),
+    }, upsert=True)
+
+
+def rebuild_totals(db):
+    """Recompute the all-lecture and queue totals."""
+    attendees = list(db.lectures.aggregate([
+        {'$group': {'_id': None, 'n': {'$sum': {'$size': {'$ifNull': ['$attendees', []]}}}}},
+    ]))
+    total = attendees[0]['n'] if attendees else 0
+    db.daily_stats.update_one({'_id': TOTALS_ID}, {'$set': {'lecture_attendees': total}}, upsert=True)
+    refresh_queues(db)
+
+
+def _loop(db):
+    try:
+        # First start on a database that predates the totals document
+        if db.daily_stats.find_one({'_id': TOTALS_ID}) is None:
+            rebuild_totals(db)
+    except Exception:
+        _stats['errors'] += 1
+        log.exception('daily stats totals rebuild failed')
+    while True:
+        time.sleep(DAILY_STATS_FLUSH_INTERVAL)
+        try:
+            flush(db)
+        except Exception:
+            _stats['errors'] += 1
+            log.exception('daily stats flush failed')
+
+
+def start(db):
+    """Start this process's flush thread (once)."""
+    global _thread
+    if _thread is not None:
+        return
+    _thread = threading.Thread(target=_loop, args=(db,), name='daily-stats', daemon=True)
+    _thread.start()
+
+
+def stats():
+    with _lock:
+        pending = sum(sum(a.values()) for a in _counts.values())
+    return {**_stats, 'pending': pending, 'flush_interval': DAILY_STATS_FLUSH_INTERVAL}
+
+
+def main():
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        sys.exit('usage: python daily_stats.py rebuild [YYYY-MM-DD]')
+    day = sys.argv[2] if len(sys.argv) > 2 else day_key(datetime.datetime.utcnow())
+
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))[os.getenv('MONGO_DB', 'unitap')]
+    rebuild(db, day)
+    rebuild_totals(db)
+    print(get_day(db, day))
+    print(get_totals(db))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Duplicate-tap suppression.
+
+A card held on a reader makes the ESP32 post the same UID several times in
+a second. The first tap for a (device_id, card_uid) pair is processed as
+usual and its result is remembered for TAP_DEBOUNCE_MS; repeats inside that
+window get the same response back without writing to MongoDB. A repeat that
+arrives while the first tap is still being processed waits for it instead of
+racing it. Only successful results are remembered, so a failed tap can be
+retried straight away. Set TAP_DEBOUNCE_MS=0 to turn this off.
+
+The window is shared by all workers through the ``tap_debounce`` collection,
+one document per pair:
+
+    {_id: 'UNITAP-001:27:9A:99:54', result: {...}, status: 201, expires_at: ...}
+
+A worker claims the pair by inserting the document, so only one worker
+processes a tap, and it stores the result there when done. A repeat on
+another worker fails the insert, reads the document and answers from it.
+Claims still being processed carry no result and lapse after
+TAP_DEBOUNCE_CLAIM_S, so a crashed worker cannot hold a card forever. A TTL
+index removes old documents. Each worker also keeps the results it produced
+in memory, so repeats on the same worker do not reach MongoDB at all.
+"""
+
+import datetime
+import os
+import threading
+import time
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import cache
+
+TAP_DEBOUNCE_MS = float(os.getenv('TAP_DEBOUNCE_MS', '1500'))
+TAP_DEBOUNCE_SIZE = int(os.getenv('TAP_DEBOUNCE_SIZE', '10000'))
+TAP_DEBOUNCE_CLAIM_S = float(os.getenv('TAP_DEBOUNCE_CLAIM_S', '30'))
+# How often a repeat checks a claim held by another worker
+POLL_INTERVAL = 0.05
+
+_recent = cache.TTLCache(TAP_DEBOUNCE_SIZE, TAP_DEBOUNCE_MS / 1000)
+_inflight = {}
+_lock = threading.Lock()
+_stats = {'processed': 0, 'suppressed': 0, 'suppressed_shared': 0, 'waited': 0}
+
+
+def run(db, device_id, card_uid, process):
+    """Return process() -> (result, status), or the remembered result if the
+    same card tapped the same reader within the window.
+    """
+    if TAP_DEBOUNCE_MS <= 0:
+        return process()
+
+    key = (device_id, card_uid)
+    while True:
+        hit = _recent.get(key)
+        if hit is not None:
+            _stats['suppressed'] += 1
+            return hit
+        with _lock:
+            pending = _inflight.get(key)
+            if pending is None:
+                _inflight[key] = threading.Event()
+                break
+        _stats['waited'] += 1
+        pending.wait(TAP_DEBOUNCE_CLAIM_S)
+
+    try:
+        doc_id = f'{device_id}:{card_uid}'
+        hit = _claim(db, doc_id)
+        if hit is not None:
+            _stats['suppressed_shared'] += 1
+            return hit
+        try:
+            result, status = process()
+        except BaseException:
+            db.tap_debounce.delete_one({'_id': doc_id, 'result': None})
+            raise
+        if status < 300:
+            _recent.set(key, (result, status))
+            db.tap_debounce.update_one({'_id': doc_id}, {'$set': {
+                'result': result, 'status': status,
+                'expires_at': datetime.datetime.utcnow() + datetime.timedelta(milliseconds=TAP_DEBOUNCE_MS),
+            }})
+        else:
+            db.tap_debounce.delete_one({'_id': doc_id, 'result': None})
+        _stats['processed'] += 1
+        return result, status
+    finally:
+        with _lock:
+            _inflight.pop(key).set()
+
+
+def _claim(db, doc_id):
+    """Claim the pair for this worker (returns None), or return the result
+    another worker stored for it within the window.
+    """
+    deadline = time.monotonic() + TAP_DEBOUNCE_CLAIM_S
+    while True:
+        now = datetime.datetime.utcnow()
+        claim = {'result': None, 'status': None, 'expires_at': now + datetime.timedelta(seconds=TAP_DEBOUNCE_CLAIM_S)}
+        try:
+            db.tap_debounce.insert_one({'_id': doc_id, **claim})
+            return None
+        except DuplicateKeyError:
+            pass
+        # Take over a document the TTL monitor has not removed yet
+        if db.tap_debounce.find_one_and_update(
+            {'_id': doc_id, 'expires_at': {'$lte': now}}, {'$set': claim}, return_document=ReturnDocument.AFTER,
+        ):
+            return None
+        doc = db.tap_debounce.find_one({'_id': doc_id})
+        if doc is None:
+            continue
+        if doc.get('result') is not None:
+            return doc['result'], doc['status']
+        if time.monotonic() >= deadline:
+            return None
+        # Another worker is still processing this tap
+        _stats['waited'] += 1
+        time.sleep(POLL_INTERVAL)
+
+
+def stats():
+    return {
+        **_stats,
+        'window_ms': TAP_DEBOUNCE_MS,
+        'tracked': _recent.stats()['size'],
+    }
@@ -0,0 +1,281 @@
+"""Index registry: every index the routes rely on, in one place.
+
+The app builds these in a background thread at startup (INDEX_BUILD_ON_STARTUP=0
+turns that off). The few in REQUIRED, which correctness depends on, are built
+synchronously by ensure_required() before the routes that need them run.
+All of them can also be built or verified from the command line:
+
+    python indexes.py build   # create any missing indexes
+    python indexes.py check   # explain() each route query shape; exit 1 on a COLLSCAN
+
+When a route gains a new query, add its shape to query_shapes() (and an index
+to INDEXES if it needs one) so `check` keeps covering it. Full listings with
+an empty filter (GET /api/devices etc.) are collection scans by design and
+are not listed.
+"""
+
+import datetime
+import logging
+import os
+import sys
+import threading
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+log = logging.getLogger(__name__)
+
+INDEX_BUILD_ON_STARTUP = os.getenv('INDEX_BUILD_ON_STARTUP', '1') == '1'
+
+# Per-device sequence numbers (scoped to the reader's boot id) make batched
+# ESP32 uploads idempotent
+TAP_SEQ_INDEX = IndexModel([('device_id', ASCENDING), ('boot', ASCENDING), ('seq', ASCENDING)],
+                           unique=True, partialFilterExpression={'seq': {'$exists': True}})
+
+INDEXES = {
+    'users': [
+        IndexModel([('card_uid', ASCENDING)]),
+        IndexModel([('email', ASCENDING)], unique=True),
+        IndexModel([('points', DESCENDING)]),
+    ],
+    'devices': [
+        IndexModel([('device_id', ASCENDING)], unique=True),
+        IndexModel([('location', ASCENDING)]),
+        IndexModel([('is_online', ASCENDING), ('last_seen', ASCENDING)]),
+    ],
+    'tap_events': [
+        # History pages and exports sort on (timestamp, _id)
+        IndexModel([('timestamp', ASCENDING), ('_id', ASCENDING)]),
+        IndexModel([('action', ASCENDING), ('timestamp', ASCENDING), ('_id', ASCENDING)]),
+        IndexModel([('user_id', ASCENDING), ('timestamp', ASCENDING), ('_id', ASCENDING)]),
+        IndexModel([('user_id', ASCENDING), ('action', ASCENDING), ('timestamp', DESCENDING)]),
+        TAP_SEQ_INDEX,
+    ],
+    'lectures': [
+        IndexModel([('start_time', ASCENDING)]),
+        IndexModel([('end_time', ASCENDING)]),
+        IndexModel([('attendees', ASCENDING)]),
+    ],
+    'events': [
+        IndexModel([('society_id', ASCENDING), ('date', ASCENDING)]),
+        IndexModel([('date', ASCENDING)]),
+        IndexModel([('device_id', ASCENDING)]),
+        IndexModel([('checked_in', ASCENDING)]),
+    ],
+    'societies': [
+        IndexModel([('members', ASCENDING)]),
+        IndexModel([('name', ASCENDING)]),
+    ],
+    'equipment': [
+        IndexModel([('device_id', ASCENDING)]),
+    ],
+    'pending_verifications': [
+        # Auto-expire pending OTP verifications after 10 minutes
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=600),
+        IndexModel([('email', ASCENDING)]),
+    ],
+    'daily_students': [
+        # Only needed while taps for that day can still arrive
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=7 * 24 * 3600),
+        IndexModel([('day', ASCENDING)]),
+    ],
+    'lecture_attendees': [
+        # Only needed while taps for that lecture can still arrive
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=7 * 24 * 3600),
+        IndexModel([('day', ASCENDING)]),
+    ],
+    'tap_debounce': [
+        # Claims and results past their window; run() also checks expires_at
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    'response_cache': [
+        IndexModel([('purge_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+    'tap_jobs': [
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)]),
+    ],
+}
+
+# Indexes that were replaced and must go, since they would still enforce
+# their old constraint (by index name)
+OBSOLETE = {
+    # Unique (device_id, seq) rejected every tap after a reader's counter restarted
+    'tap_events': ['device_id_1_seq_1'],
+}
+
+# Indexes that correctness (not just speed) depends on. ensure_required()
+# builds them synchronously, whatever INDEX_BUILD_ON_STARTUP says.
+REQUIRED = {
+    'tap_events': [TAP_SEQ_INDEX],
+}
+
+
+def query_shapes():
+    """(name, collection, explain command) for each filtered query the routes run.
+    Values are placeholders; only the shape matters to the planner.
+    """
+    oid = ObjectId()
+    now = datetime.datetime.utcnow()
+    week_ago = now - datetime.timedelta(days=7)
+
+    def find(coll, flt, sort=None):
+        cmd = {'find': coll, 'filter': flt}
+        if sort:
+            cmd['sort'] = sort
+        return coll, cmd
+
+    def aggregate(coll, pipeline):
+        return coll, {'aggregate': coll, 'pipeline': pipeline, 'cursor': {}}
+
+    return [
+        ('tap: user by card', *find('users', {'card_uid': 'CARD'})),
+        ('tap: device by id', *find('devices', {'device_id': 'DEV'})),
+        ('tap: event by device', *find('events', {'device_id': 'DEV'})),
+        ('tap: equipment by device', *find('equipment', {'device_id': 'DEV'})),
+        ('tap: batch seq dedupe', *find('tap_events', {'device_id': 'DEV', 'boot': 'BOOT', 'seq': {'$in': [1, 2]}})),
+        ('tap: history', *find('tap_events', {'timestamp': {'$gte': week_ago}}, {'timestamp': -1, '_id': -1})),
+        ('tap: history by action', *find('tap_events', {'action': 'attendance'}, {'timestamp': -1, '_id': -1})),
+        ('tap: history by user', *find('tap_events', {'user_id': oid}, {'timestamp': -1, '_id': -1})),
+        ('tap: history page', *find('tap_events', {'$or': [
+            {'timestamp': {'$lt': now}},
+            {'timestamp': now, '_id': {'$lt': oid}},
+        ]}, {'timestamp': -1, '_id': -1})),
+        ('stats: events this week', *aggregate('events', [
+            {'$match': {'date': {'$gte': week_ago, '$lt': now}}}, {'$count': 'n'}])),
+        ('auth: user by email', *find('users', {'email': 'someone@kcl.ac.uk'})),
+        ('auth: pending verification', *find('pending_verifications', {'email': 'someone@kcl.ac.uk'})),
+        ('auth: my attendance', *find('lectures', {'attendees': oid}, {'start_time': -1})),
+        ('auth: my societies', *find('societies', {'members': oid})),
+        ('auth: my events', *find('events', {'society_id': {'$in': [oid]}}, {'date': 1})),
+        ('societies: events', *find('events', {'society_id': oid}, {'date': 1})),
+        ('societies: by name', *find('societies', {'name': 'Robotics'})),
+        ('societies: device at location', *find('devices', {'location': 'Great Hall'})),
+        ('attendance: lectures by date', *find('lectures', {'start_time': {'$gte': week_ago, '$lt': now}},
+                                               {'start_time': 1})),
+        ('attendance: ended lectures', *find('lectures', {'end_time': {'$lt': now}}, {'start_time': 1})),
+        ('gamification: weekly leaderboard', *aggregate('tap_events', [
+            {'$match': {'timestamp': {'$gte': week_ago}, 'action': 'attendance'}},
+            {'$group': {'_id': '$user_id', 'taps': {'$sum': 1}}}])),
+        ('gamification: my taps', *aggregate('tap_events', [
+            {'$match': {'user_id': oid, 'action': 'attendance', 'timestamp': {'$gte': week_ago}}},
+            {'$count': 'n'}])),
+        ('gamification: points rank', *aggregate('users', [
+            {'$match': {'points': {'$gt': 100}}}, {'$count': 'n'}])),
+        ('worker: top 10 floor', *find('users', {}, {'points': -1})),
+        ('worker: society star', *aggregate('events', [{'$match': {'checked_in': oid}}, {'$count': 'n'}])),
+        ('worker: claim jobs', *find('tap_jobs', {'$or': [
+            {'status': 'pending'},
+            {'status': 'claimed', 'claimed_at': {'$lt': now}},
+        ]}, {'created_at': 1})),
+        ('presence: offline sweep', *find('devices', {'is_online': True, 'last_seen': {'$lt': now}})),
+    ]
+
+
+def build(db):
+    """Create every registered index and drop the obsolete ones. Returns the
+    number that failed. Existing indexes are left alone, so this is safe to
+    run on every start.
+    """
+    failed = 0
+    for coll, models in INDEXES.items():
+        for model in models:
+            try:
+                db[coll].create_indexes([model])
+            except OperationFailure as e:
+                failed += 1
+                log.error('index %s on %s failed: %s', model.document['key'], coll, e)
+    # After the replacements exist, so the constraint never lapses
+    try:
+        _drop_obsolete(db)
+    except OperationFailure as e:
+        failed += 1
+        log.error('dropping obsolete indexes failed: %s', e)
+    return failed
+
+
+def _drop_obsolete(db):
+    for coll, names in OBSOLETE.items():
+        existing = db[coll].index_information()
+        for name in names:
+            if name in existing:
+                db[coll].drop_index(name)
+                log.info('dropped obsolete index %s on %s', name, coll)
+
+
+_required_built = False
+_required_lock = threading.Lock()
+
+
+def ensure_required(db):
+    """Build the REQUIRED indexes (and drop the obsolete ones) once per process,
+    blocking until done. Raises OperationFailure if that fails, so a caller
+    never runs without them.
+    """
+    global _required_built
+    if _required_built:
+        return
+    with _required_lock:
+        if not _required_built:
+            for coll, models in REQUIRED.items():
+                db[coll].create_indexes(models)
+            _drop_obsolete(db)
+            _required_built = True
+
+
+def _collscans(plan):
+    """Yield every COLLSCAN stage inside an explain()'s winning plans."""
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key == 'rejectedPlans':
+                continue
+            if key == 'stage' and value == 'COLLSCAN':
+                yield plan
+            yield from _collscans(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _collscans(item)
+
+
+def check(db, out=sys.stdout):
+    """Explain each query shape; returns the names of those that scan a collection."""
+    scans = []
+    for name, coll, cmd in query_shapes():
+        explain = db.command('explain', cmd, verbosity='queryPlanner')
+        ok = not any(_collscans(explain))
+        if not ok:
+            scans.append(name)
+        print(f'{"ok  " if ok else "SCAN"}  {coll:<22} {name}', file=out)
+    return scans
+
+
+def start(db):
+    """Build indexes in a background thread so startup is not blocked."""
+    if not INDEX_BUILD_ON_STARTUP:
+        return
+    threading.Thread(target=build, args=(db,), name='index-build', daemon=True).start()
+
+
+def main():
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'check'
+    if command not in ('build', 'check'):
+        sys.exit('usage: python indexes.py [build|check]')
+
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))[os.getenv('MONGO_DB', 'unitap')]
+    if command == 'build':
+        failed = build(db)
+        print(f'{sum(len(m) for m in INDEXES.values()) - failed} indexes ensured, {failed} failed')
+        sys.exit(1 if failed else 0)
+
+    scans = check(db)
+    if scans:
+        print(f'FAIL: {len(scans)} query shape(s) scan a collection: {", ".join(scans)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
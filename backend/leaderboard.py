@@ -0,0 +1,380 @@
+"""All-time leaderboard: materialized counts, in-memory ranking, delta stream.
+
+get_leaderboard's all-time view ranks users by attendance taps (points are
+taps x 10). Regrouping every attendance tap per request grew with the tap
+history, so the counts are materialized in ``leaderboard_counts``:
+
+    {_id: user_id, taps: 42, name: 'Alice Chen', last_tap: ObjectId(...)}
+
+Like daily_stats, stored taps are recorded in memory and a background thread
+folds them in every LEADERBOARD_FLUSH_INTERVAL seconds with one upserted $inc
+per user, so the tap path does no extra writes. ``python leaderboard.py
+rebuild`` recomputes the collection from tap_events. A process that finds it
+empty at start does the same.
+
+Each process loads the counts into a Ranking, which is a Fenwick tree over
+tap counts. Both a user's rank and the top N are answered in O(log n), and
+tied users share a rank (users strictly ahead + 1). Between loads the ranking
+follows the tap stream (tap_stream.listen), which carries every worker's
+taps. last_tap is the newest tap folded into a row, so a stream tap at or
+below the loaded last_tap (e.g. one replayed by the reader's resume overlap)
+is already in the count and skipped. It is reloaded every LEADERBOARD_RELOAD
+seconds to pick up anything the stream missed. A reload only ever raises a
+count, because the collection lags the stream by up to one flush. Restart
+the workers after a rebuild that lowers counts.
+
+For each attendance tap, the user moves up in the ranking, and a ``delta``
+event goes out on /api/stream/leaderboard:
+
+    {"user_id": ..., "name": ..., "taps": 12, "points": 120,
+     "rank": 4, "prev_rank": 6, "passed_taps": 11}
+
+Everyone else who had passed_taps taps (the user's old count) is now one rank
+lower, and clients adjust their own row from that. So a tap produces one
+small message however many users are tied, and no aggregation runs per update.
+"""
+
+import heapq
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+import tap_stream
+
+log = logging.getLogger(__name__)
+
+LEADERBOARD_FLUSH_INTERVAL = float(os.getenv('LEADERBOARD_FLUSH_INTERVAL', '1'))
+LEADERBOARD_RELOAD = float(os.getenv('LEADERBOARD_RELOAD', '300'))
+POINTS_PER_TAP = 10
+
+channel = tap_stream.Channel('leaderboard')
+
+
+class Fenwick:
+    """Prefix sums over 1..size with O(log n) updates, sums and searches."""
+
+    def __init__(self, size, values=None):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        for i, value in (values or {}).items():
+            self.tree[i] += value
+        # Linear-time build: push each node's sum into its parent
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, i, delta):
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """Sum of 1..i."""
+        i = min(i, self.size)
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def search(self, k):
+        """Smallest i whose prefix sum reaches k (1 <= k <= total)."""
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos + 1
+
+
+class Ranking:
+    """Attendance counts per user (string ids), with a Fenwick tree over the
+    counts: tree[c] is the number of users with exactly c taps.
+    """
+
+    def __init__(self, rows=()):
+        self.counts = {}
+        self.names = {}
+        self.marks = {}  # user id -> newest tap id already counted (last_tap)
+        self.buckets = {}  # count -> set of user ids
+        for user_id, count, name, mark in rows:
+            if count > 0:
+                self.counts[user_id] = count
+                self.names[user_id] = name
+                self.buckets.setdefault(count, set()).add(user_id)
+            if mark:
+                self.marks[user_id] = mark
+        self._build(max(self.buckets, default=0))
+
+    def _build(self, max_count):
+        size = 1024
+        while size < max_count:
+            size *= 2
+        self.tree = Fenwick(size, {count: len(users) for count, users in self.buckets.items()})
+
+    def ahead(self, count):
+        """Users with more than count taps."""
+        return len(self.counts) - self.tree.prefix(count)
+
+    def rank(self, user_id):
+        return self.ahead(self.counts.get(user_id, 0)) + 1
+
+    def set(self, user_id, count, name=None):
+        """Set a user's tap count (count >= 1). Returns the old count."""
+        old = self.counts.get(user_id, 0)
+        if old:
+            self.buckets[old].discard(user_id)
+            if not self.buckets[old]:
+                del self.buckets[old]
+            self.tree.add(old, -1)
+        self.counts[user_id] = count
+        self.buckets.setdefault(count, set()).add(user_id)
+        if count > self.tree.size:
+            self._build(count)
+        else:
+            self.tree.add(count, 1)
+        if name:
+            self.names[user_id] = name
+        return old
+
+    def counted(self, user_id, tap_id):
+        """Whether a tap is already included in the user's loaded count."""
+        mark = self.marks.get(user_id)
+        return mark is not None and tap_id is not None and tap_id <= mark
+
+    def remove(self, user_id):
+        """Drop a user (e.g. deleted from users) from the ranking."""
+        old = self.counts.pop(user_id, 0)
+        if old:
+            self.buckets[old].discard(user_id)
+            if not self.buckets[old]:
+                del self.buckets[old]
+            self.tree.add(old, -1)
+        self.names.pop(user_id, None)
+        self.marks.pop(user_id, None)
+
+    def add(self, user_id, n=1, name=None):
+        """Count n more taps for a user. Returns (old count, new count)."""
+        new = self.counts.get(user_id, 0) + n
+        return self.set(user_id, new, name), new
+
+    def top(self, n):
+        """The n users with the most taps as [(user_id, taps)], ties by id."""
+        total = len(self.counts)
+        result = []
+        while len(result) < min(n, total):
+            # Taps of the user ranked len(result) + 1 from the top
+            count = self.tree.search(total - len(result))
+            tied = self.buckets[count]
+            result.extend((user_id, count) for user_id in heapq.nsmallest(n - len(result), tied))
+        return result
+
+
+_ranking = None
+_pending = {}  # user_id -> [taps, name, newest tap id]
+_lock = threading.Lock()
+_thread = None
+_stats = {'recorded': 0, 'flushes': 0, 'reloads': 0, 'rebuilds': 0, 'deltas': 0, 'errors': 0}
+
+
+def record(taps):
+    """Count stored tap events (dicts with user_id, user_name and action)."""
+    with _lock:
+        for tap in taps:
+            if tap['action'] != 'attendance':
+                continue
+            entry = _pending.setdefault(tap['user_id'], [0, None, None])
+            entry[0] += 1
+            entry[1] = tap.get('user_name') or entry[1]
+            entry[2] = max(tap['_id'], entry[2]) if entry[2] else tap['_id']
+            _stats['recorded'] += 1
+
+
+def flush(db):
+    """Fold recorded taps into leaderboard_counts. Returns the number of users written."""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    if not pending:
+        return 0
+    ops = []
+    for user_id, (n, name, last_tap) in pending.items():
+        update = {'$inc': {'taps': n}, '$max': {'last_tap': last_tap}}
+        if name:
+            update['$set'] = {'name': name}
+        ops.append(UpdateOne({'_id': user_id}, update, upsert=True))
+    db.leaderboard_counts.bulk_write(ops, ordered=False)
+    _stats['flushes'] += 1
+    return len(ops)
+
+
+def rebuild(db):
+    """Recompute leaderboard_counts from tap_events (one aggregation).
+    Each user's row is replaced with an upsert, so workers that rebuild an
+    empty collection at the same time write the same rows without conflict.
+    """
+    ops = [
+        ReplaceOne({'_id': r['_id']}, {'taps': r['taps'], 'name': r.get('name') or '', 'last_tap': r['last_tap']},
+                   upsert=True)
+        for r in db.tap_events.aggregate([
+            {'$match': {'action': 'attendance'}},
+            {'$group': {'_id': '$user_id', 'taps': {'$sum': 1}, 'name': {'$last': '$user_name'},
+                        'last_tap': {'$max': '$_id'}}},
+        ])
+    ]
+    if ops:
+        db.leaderboard_counts.bulk_write(ops, ordered=False)
+    _stats['rebuilds'] += 1
+    return len(ops)
+
+
+def load(db):
+    """Load leaderboard_counts into this process's ranking, building the
+    collection first if it is empty. Rows for users that no longer exist are
+    left out, as the old $lookup on users did. Returns the ranking.
+    """
+    global _ranking
+    docs = list(db.leaderboard_counts.find())
+    if not docs and db.tap_events.find_one({'action': 'attendance'}, {'_id': 1}):
+        rebuild(db)
+        docs = list(db.leaderboard_counts.find())
+    # Read after the counts, so every counted user created before now is found
+    existing = {u['_id'] for u in db.users.find({}, {'_id': 1})}
+    rows = [(str(d['_id']), d.get('taps', 0), d.get('name', ''), d.get('last_tap'))
+            for d in docs if d['_id'] in existing]
+    deleted = [str(d['_id']) for d in docs if d['_id'] not in existing]
+    with _lock:
+        if _ranking is None:
+            _ranking = Ranking(rows)
+        else:
+            for user_id in deleted:
+                _ranking.remove(user_id)
+            # The stream may be ahead of the collection; never move anyone down
+            for user_id, count, name, mark in rows:
+                if count > _ranking.counts.get(user_id, 0):
+                    _ranking.set(user_id, count, name)
+                if mark and not _ranking.counted(user_id, mark):
+                    _ranking.marks[user_id] = mark
+        ranking = _ranking
+    _stats['reloads'] += 1
+    return ranking
+
+
+def _ready(db):
+    if _ranking is None:
+        load(db)
+
+
+def top(db, n):
+    """The n users with the most attendance taps as [(user_id, taps)]."""
+    _ready(db)
+    with _lock:
+        return _ranking.top(n)
+
+
+def forget(user_ids):
+    """Drop users that turned out to be deleted until the next reload."""
+    with _lock:
+        if _ranking is not None:
+            for user_id in user_ids:
+                _ranking.remove(str(user_id))
+
+
+def standing(db, user_id):
+    """(attendance taps, rank) for a user id."""
+    _ready(db)
+    user_id = str(user_id)
+    with _lock:
+        return _ranking.counts.get(user_id, 0), _ranking.rank(user_id)
+
+
+def _on_tap(event):
+    """tap_stream listener: move the tapping user and emit the delta."""
+    if event.event or event.topics.get('action') != 'attendance' or 'user_id' not in event.topics:
+        return
+    user_id = event.topics['user_id']
+    tap = json.loads(event.json)
+    name = tap.get('user_name')
+    tap_id = ObjectId(tap['_id']) if ObjectId.is_valid(tap.get('_id')) else None
+    with _lock:
+        if _ranking is None:
+            # Not loaded yet; the load will include this tap once it is flushed
+            return
+        if _ranking.counted(user_id, tap_id):
+            # Flushed before the load (the reader replays a short overlap)
+            return
+        prev_rank = _ranking.rank(user_id)
+        old, new = _ranking.add(user_id, 1, name)
+        rank = _ranking.ahead(new) + 1
+        name = _ranking.names.get(user_id, '')
+    channel.emit(event.id, {
+        'user_id': user_id,
+        'name': name,
+        'taps': new,
+        'points': new * POINTS_PER_TAP,
+        'rank': rank,
+        'prev_rank': prev_rank,
+        'passed_taps': old,
+    }, event='delta', topics={'user_id': user_id})
+    _stats['deltas'] += 1
+
+
+def _loop(db):
+    last_reload = time.monotonic()
+    while True:
+        time.sleep(LEADERBOARD_FLUSH_INTERVAL)
+        try:
+            flush(db)
+            if time.monotonic() - last_reload >= LEADERBOARD_RELOAD:
+                load(db)
+                last_reload = time.monotonic()
+        except Exception:
+            _stats['errors'] += 1
+            log.exception('leaderboard flush failed')
+
+
+def start(db):
+    """Load the ranking, follow the tap stream and start the flush thread (once)."""
+    global _thread
+    if _thread is not None:
+        return
+    tap_stream.listen(_on_tap)
+    try:
+        load(db)
+    except Exception:
+        _stats['errors'] += 1
+        log.exception('initial leaderboard load failed')
+    _thread = threading.Thread(target=_loop, args=(db,), name='leaderboard', daemon=True)
+    _thread.start()
+
+
+def stats():
+    with _lock:
+        users = len(_ranking.counts) if _ranking is not None else 0
+        pending = sum(n for n, _ in _pending.values())
+    return {**_stats, 'users': users, 'pending': pending,
+            'flush_interval': LEADERBOARD_FLUSH_INTERVAL, 'stream': channel.stats()}
+
+
+def main():
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        sys.exit('usage: python leaderboard.py rebuild')
+
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))[os.getenv('MONGO_DB', 'unitap')]
+    print(f'{rebuild(db)} users in leaderboard_counts')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Load-test /api/nfc-events with a simulated fleet of ESP32 readers.
+
+Start the API the way production runs it, against a local mongod, then:
+
+    uvicorn asgi:app --workers 2 --host 127.0.0.1 --port 5000
+    python loadtest.py --readers 50 --duration 60
+    python loadtest.py --readers 200 --slot 20 --students 80 --url http://127.0.0.1:5000
+
+Each reader is a thread with its own keep-alive connection. Time is
+compressed into slots of --slot seconds, each standing for one lecture
+changeover. Most students arrive in a burst around the start of the slot and
+the rest trickle in, so the server sees the same spikes it will see on the
+hour during term. Each student taps once per slot, so debouncing does not
+hide the load.
+
+Readers are spread over the attendance devices in MONGO_URI/MONGO_DB, and
+cards are drawn from users with linked cards. Both pools are loaded once up
+front. Latency is measured from when a tap was due, not when it was sent, so
+a server that falls behind shows up in the percentiles instead of slowing the
+load down.
+"""
+
+import argparse
+import collections
+import http.client
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+
+def load_pools(db, max_cards):
+    """Attendance device ids and linked card UIDs, fetched once."""
+    devices = [d['device_id'] for d in db.devices.find({'mode': 'attendance'}, {'device_id': 1})]
+    cards = [u['card_uid'] for u in db.users.find(
+        {'card_uid': {'$nin': [None, '']}}, {'card_uid': 1}).limit(max_cards)]
+    return devices, cards
+
+
+def slot_offsets(students, slot, rng, burst_share=0.8, burst_center=0.15, burst_width=0.05):
+    """Tap times within one slot: a Gaussian burst near the start plus a uniform trickle."""
+    offsets = []
+    for _ in range(students):
+        if rng.random() < burst_share:
+            offset = rng.gauss(burst_center * slot, burst_width * slot)
+        else:
+            offset = rng.uniform(0, slot)
+        offsets.append(min(max(offset, 0.0), slot * 0.999))
+    return sorted(offsets)
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.statuses = collections.Counter()
+
+    def add(self, latency_ms, status):
+        with self._lock:
+            self.latencies.append(latency_ms)
+            self.statuses[status] += 1
+
+
+def reader(url, device_id, cards, args, seed, results, stop_at):
+    """Tap like one ESP32 until stop_at, slot after slot."""
+    rng = random.Random(seed)
+    parts = urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    conn = conn_cls(parts.netloc, timeout=args.timeout)
+    path = (parts.path.rstrip('/') or '') + '/api/nfc-events'
+    headers = {'Content-Type': 'application/json'}
+
+    # Readers do not all start their slots at the same instant
+    slot_start = time.perf_counter() + rng.uniform(0, args.jitter)
+    while slot_start < stop_at:
+        students = rng.sample(cards, min(args.students, len(cards)))
+        for offset, card in zip(slot_offsets(len(students), args.slot, rng), students):
+            due = slot_start + offset
+            if due >= stop_at:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            body = json.dumps({'uid': card, 'device_id': device_id, 'ts': int(time.time()), 'type': 'attendance'})
+            try:
+                conn.request('POST', path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+            except (OSError, http.client.HTTPException) as e:
+                status = type(e).__name__
+                conn.close()
+                conn = conn_cls(parts.netloc, timeout=args.timeout)
+            results.add((time.perf_counter() - due) * 1000, status)
+        slot_start += args.slot
+    conn.close()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=os.getenv('LOADTEST_URL', 'http://127.0.0.1:5000'), help='API base URL')
+    parser.add_argument('--readers', type=int, default=20, help='concurrent simulated readers')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run')
+    parser.add_argument('--slot', type=float, default=30, help='seconds per simulated lecture changeover')
+    parser.add_argument('--students', type=int, default=60, help='taps per reader per slot')
+    parser.add_argument('--jitter', type=float, default=2, help='max random delay before a reader starts')
+    parser.add_argument('--timeout', type=float, default=10, help='per-request timeout in seconds')
+    parser.add_argument('--max-cards', type=int, default=100000, help='cards to load into the pool')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))[os.getenv('MONGO_DB', 'unitap')]
+    devices, cards = load_pools(db, args.max_cards)
+    if not devices or not cards:
+        raise SystemExit('Need attendance devices and users with linked cards; run seed.py first.')
+    print(f'{args.readers} readers over {len(devices)} devices, {len(cards)} cards, '
+          f'{args.duration:g}s in {args.slot:g}s slots of {args.students} taps -> {args.url}')
+
+    results = Results()
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    threads = [
+        threading.Thread(target=reader, daemon=True, args=(
+            args.url, devices[i % len(devices)], cards, args, args.seed * 100003 + i, results, stop_at))
+        for i in range(args.readers)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    lat = results.latencies
+    if not lat:
+        raise SystemExit('No taps were sent.')
+    ok = sum(n for status, n in results.statuses.items() if status in (200, 201))
+    print(f'taps={len(lat)} ok={ok} throughput={len(lat) / elapsed:.1f}/s')
+    print(f'latency ms: p50={percentile(lat, 50):.1f} p95={percentile(lat, 95):.1f} '
+          f'p99={percentile(lat, 99):.1f} max={max(lat):.1f} mean={statistics.mean(lat):.1f}')
+    print('statuses: ' + ', '.join(f'{status}={n}' for status, n in results.statuses.most_common()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Device presence: coalesced last_seen writes and an offline sweeper.
+
+Taps and heartbeats only record the time in memory. A background thread in
+each process flushes the table every PRESENCE_FLUSH_INTERVAL seconds with one
+bulk write (so a device is written at most once per interval, however busy),
+then marks devices offline once their last_seen is older than
+DEVICE_OFFLINE_AFTER seconds. Keep DEVICE_OFFLINE_AFTER well above the flush
+interval: another worker's unflushed sightings are invisible to the sweep.
+"""
+
+import datetime
+import logging
+import os
+import threading
+from pymongo import UpdateOne
+
+log = logging.getLogger(__name__)
+
+PRESENCE_FLUSH_INTERVAL = float(os.getenv('PRESENCE_FLUSH_INTERVAL', '10'))
+DEVICE_OFFLINE_AFTER = float(os.getenv('DEVICE_OFFLINE_AFTER', '120'))
+
+_lock = threading.Lock()
+_pending = {}
+_thread = None
+_stats = {'seen': 0, 'flushes': 0, 'writes': 0, 'marked_offline': 0, 'errors': 0}
+
+
+def seen(device_id, when=None):
+    """Record that a device was just heard from (tap or heartbeat)."""
+    when = when or datetime.datetime.utcnow()
+    with _lock:
+        if when > _pending.get(device_id, when - datetime.timedelta(seconds=1)):
+            _pending[device_id] = when
+        _stats['seen'] += 1
+
+
+def flush(db):
+    """Write pending last_seen values in one bulk write. Returns devices written."""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    if not pending:
+        return 0
+    # $max keeps the newest value when several workers flush the same device
+    db.devices.bulk_write([
+        UpdateOne({'device_id': device_id}, {'$max': {'last_seen': when}, '$set': {'is_online': True}})
+        for device_id, when in pending.items()
+    ], ordered=False)
+    _stats['flushes'] += 1
+    _stats['writes'] += len(pending)
+    return len(pending)
+
+
+def sweep(db):
+    """Mark devices offline after DEVICE_OFFLINE_AFTER seconds of silence."""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=DEVICE_OFFLINE_AFTER)
+    result = db.devices.update_many(
+        {'is_online': True, 'last_seen': {'$lt': cutoff}},
+        {'$set': {'is_online': False}}
+    )
+    _stats['marked_offline'] += result.modified_count
+    return result.modified_count
+
+
+def _loop(db, stop):
+    while not stop.wait(PRESENCE_FLUSH_INTERVAL):
+        try:
+            flush(db)
+            sweep(db)
+        except Exception:
+            _stats['errors'] += 1
+            log.exception('presence flush failed')
+
+
+def start(db):
+    """Start this process's flush / sweep thread (once)."""
+    global _thread
+    if _thread is not None:
+        return
+    _thread = threading.Thread(target=_loop, args=(db, threading.Event()), name='presence', daemon=True)
+    _thread.start()
+
+
+def stats():
+    with _lock:
+        pending = len(_pending)
+    return {
+        **_stats,
+        'pending': pending,
+        'flush_interval': PRESENCE_FLUSH_INTERVAL,
+        'offline_after': DEVICE_OFFLINE_AFTER,
+    }
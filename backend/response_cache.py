@@ -0,0 +1,209 @@
+"""Short-lived response cache for dashboard endpoints, shared by all workers.
+
+Every open dashboard refetches /api/stats, the leaderboard and the tap feed
+when a tap is broadcast, so identical requests arrive at both gunicorn
+workers at once. Decorated views keep their rendered response in the
+``response_cache`` collection, keyed by path, query args and an optional
+``vary`` value (e.g. the caller's user id):
+
+    @tap_bp.route('/stats')
+    @response_cache.cached(ttl=2)
+    def get_stats(): ...
+
+An entry is fresh until its ttl runs out or until a tap is broadcast after
+it was computed. broadcast_tap calls invalidate(), which moves a shared
+watermark forward with one unacknowledged write. A lookup fetches the entry
+and the watermark in a single query.
+
+Recomputation is single-flight. Within a process, one thread per key
+recomputes and the others wait for it. Across processes, the worker that
+takes the entry's lease recomputes, and the others serve the previous
+response until the new one is stored. If there is no previous response,
+they wait for the new one.
+"""
+
+import datetime
+import functools
+import os
+import threading
+import time
+from flask import request, current_app
+from pymongo import WriteConcern
+from pymongo.errors import DuplicateKeyError
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', '1') == '1'
+RESPONSE_CACHE_LEASE = float(os.getenv('RESPONSE_CACHE_LEASE', '5'))
+RESPONSE_CACHE_POLL = 0.025
+
+WATERMARK_ID = 'watermark'
+
+_locks = {}  # key -> [lock, threads using it]; removed when the last one is done
+_locks_guard = threading.Lock()
+_stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'joined': 0, 'waited': 0, 'invalidations': 0}
+
+
+def get_db():
+    from app import db
+    return db
+
+
+def _key(vary):
+    args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+    key = f'{request.path}?{args}'
+    if vary is not None:
+        key += f'|{vary()}'
+    return key
+
+
+def _lookup(db, key):
+    """Return (entry or None, watermark) with one query."""
+    entry, watermark = None, 0.0
+    for doc in db.response_cache.find({'_id': {'$in': [key, WATERMARK_ID]}}):
+        if doc['_id'] == WATERMARK_ID:
+            watermark = doc.get('at', 0.0)
+        else:
+            entry = doc
+    return entry, watermark
+
+
+def _fresh(entry, watermark):
+    return (entry is not None and 'body' in entry
+            and entry['expires_at'] > time.time() and entry['computed_at'] > watermark)
+
+
+# Headers that are recomputed for every response rather than replayed
+_SKIP_HEADERS = {'Content-Length', 'Content-Type'}
+
+
+def _respond(entry):
+    return current_app.response_class(entry['body'], status=entry['status'], mimetype=entry['mimetype'],
+                                      headers=entry.get('headers', []))
+
+
+def _take_lease(db, key):
+    """Claim the right to recompute key across workers. True if we got it."""
+    now = time.time()
+    try:
+        db.response_cache.update_one(
+            {'_id': key, '$or': [{'lease_until': {'$lt': now}}, {'lease_until': {'$exists': False}}]},
+            {'$set': {'lease_until': now + RESPONSE_CACHE_LEASE}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        # The entry exists and another worker holds its lease
+        return False
+
+
+def _compute(db, key, ttl, view, args, kwargs):
+    computed_at = time.time()
+    response = current_app.make_response(view(*args, **kwargs))
+    if response.status_code == 200 and not response.is_streamed:
+        db.response_cache.update_one({'_id': key}, {'$set': {
+            'body': response.get_data(),
+            'status': response.status_code,
+            'mimetype': response.mimetype,
+            'headers': [[k, v] for k, v in response.headers.items() if k not in _SKIP_HEADERS],
+            'computed_at': computed_at,
+            'expires_at': computed_at + ttl,
+            'lease_until': 0.0,
+            'purge_at': datetime.datetime.utcnow() + datetime.timedelta(seconds=max(ttl, 60)),
+        }}, upsert=True)
+    else:
+        db.response_cache.update_one({'_id': key}, {'$set': {'lease_until': 0.0}})
+    return response
+
+
+def _hold_lock(key):
+    """The recompute lock for key, counted as in use until _drop_lock(key)."""
+    with _locks_guard:
+        held = _locks.get(key)
+        if held is None:
+            held = _locks[key] = [threading.Lock(), 0]
+        held[1] += 1
+        return held[0]
+
+
+def _drop_lock(key):
+    with _locks_guard:
+        held = _locks[key]
+        held[1] -= 1
+        if not held[1]:
+            del _locks[key]
+
+
+def _serve(db, key, ttl, view, args, kwargs):
+    entry, watermark = _lookup(db, key)
+    if _fresh(entry, watermark):
+        _stats['hits'] += 1
+        return _respond(entry)
+
+    lock = _hold_lock(key)
+    try:
+        return _serve_locked(db, key, ttl, view, args, kwargs, lock, entry)
+    finally:
+        _drop_lock(key)
+
+
+def _serve_locked(db, key, ttl, view, args, kwargs, lock, entry):
+    if not lock.acquire(blocking=False):
+        # Another thread in this process is recomputing; wait for it
+        _stats['joined'] += 1
+        with lock:
+            pass
+        entry, watermark = _lookup(db, key)
+        if _fresh(entry, watermark):
+            _stats['hits'] += 1
+            return _respond(entry)
+        lock.acquire()
+
+    try:
+        deadline = time.time() + RESPONSE_CACHE_LEASE
+        while not _take_lease(db, key):
+            if entry is not None and 'body' in entry:
+                _stats['stale_hits'] += 1
+                return _respond(entry)
+            _stats['waited'] += 1
+            time.sleep(RESPONSE_CACHE_POLL)
+            entry, watermark = _lookup(db, key)
+            if _fresh(entry, watermark):
+                _stats['hits'] += 1
+                return _respond(entry)
+            if time.time() > deadline:
+                break
+        _stats['misses'] += 1
+        return _compute(db, key, ttl, view, args, kwargs)
+    finally:
+        lock.release()
+
+
+def cached(ttl, vary=None):
+    """Cache a GET view's 200 responses for ttl seconds or until the next tap.
+    vary: optional callable whose result is added to the key.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not RESPONSE_CACHE_ENABLED:
+                return view(*args, **kwargs)
+            return _serve(get_db(), _key(vary), ttl, view, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def invalidate(db):
+    """Mark every cached response stale. Unacknowledged, so it costs the caller
+    no round trip; entries computed after this moment already include the change.
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return
+    db.response_cache.with_options(write_concern=WriteConcern(w=0)).update_one(
+        {'_id': WATERMARK_ID}, {'$max': {'at': time.time()}}, upsert=True
+    )
+    _stats['invalidations'] += 1
+
+
+def stats():
+    with _locks_guard:
+        locks = len(_locks)
+    return {**_stats, 'enabled': RESPONSE_CACHE_ENABLED, 'locks': locks}
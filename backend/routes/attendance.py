@@ -1,6 +1,7 @@
 import datetime
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
+import schedule
 
 attendance_bp = Blueprint('attendance', __name__)
 
@@ -14,13 +15,7 @@ def serialize_lecture(lecture):
     now = datetime.datetime.utcnow()
     start = lecture.get('start_time', now)
     end = lecture.get('end_time', now)
-
-    if now < start:
-        status = 'upcoming'
-    elif now > end:
-        status = 'ended'
-    else:
-        status = 'live'
+    status = schedule.status_at({'start_time': start, 'end_time': end}, now)
 
     return {
         '_id': str(lecture['_id']),
@@ -31,7 +26,7 @@ def serialize_lecture(lecture):
         'end_time': end.isoformat(),
         'device_id': lecture.get('device_id', ''),
         'expected_students': lecture.get('expected_students', 0),
-        'checked_in': len(lecture.get('attendees', [])),
+        'checked_in': lecture['checked_in'] if 'checked_in' in lecture else len(lecture.get('attendees', [])),
         'status': status,
     }
 
@@ -51,13 +46,22 @@ def get_lectures():
         except ValueError:
             pass
 
-    lectures = list(db.lectures.find(query).sort('start_time', 1))
-    serialized = [serialize_lecture(l) for l in lectures]
-
+    # Status is a condition on the stored times, merged with any date range
     if status_filter:
-        serialized = [l for l in serialized if l['status'] == status_filter]
-
-    return jsonify(serialized)
+        conditions = schedule.status_query(status_filter, datetime.datetime.utcnow())
+        if conditions is None:
+            return jsonify([])
+        for field, condition in conditions.items():
+            query.setdefault(field, {}).update(condition)
+
+    # Count attendees server-side instead of shipping the arrays
+    lectures = db.lectures.aggregate([
+        {'$match': query},
+        {'$sort': {'start_time': 1}},
+        {'$addFields': {'checked_in': {'$size': {'$ifNull': ['$attendees', []]}}}},
+        {'$project': {'attendees': 0}},
+    ])
+    return jsonify([serialize_lecture(l) for l in lectures])
 
 
 @attendance_bp.route('/lectures/<lecture_id>', methods=['GET'])
@@ -7,6 +7,7 @@ import os
 from bson import ObjectId
 from functools import wraps
 import resend
+import cache
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -238,14 +239,17 @@ def link_card():
     if existing and str(existing['_id']) != user_id:
         return jsonify({'message': 'Card already linked to another account'}), 400
 
-    result = db.users.update_one(
+    previous = db.users.find_one_and_update(
         {'_id': ObjectId(user_id)},
-        {'$set': {'card_uid': card_uid}}
+        {'$set': {'card_uid': card_uid}},
+        projection={'card_uid': 1},
     )
 
-    if result.matched_count == 0:
+    if previous is None:
         return jsonify({'message': 'User not found'}), 404
 
+    cache.users_by_card.invalidate(card_uid, previous.get('card_uid'))
+
     user = db.users.find_one({'_id': ObjectId(user_id)})
     return jsonify(serialize_user(user))
 
@@ -276,6 +280,7 @@ def link_card_by_email():
         {'_id': user['_id']},
         {'$set': {'card_uid': card_uid}}
     )
+    cache.users_by_card.invalidate(card_uid, user.get('card_uid'))
 
     return jsonify({'message': 'Card linked successfully', 'user_name': user['name']})
 
@@ -1,6 +1,8 @@
 import datetime
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
+import cache
+import presence
 
 devices_bp = Blueprint('devices', __name__)
 
@@ -50,6 +52,21 @@ def register_device():
     return jsonify(serialize_device(device)), 201
 
 
+@devices_bp.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    """Keep-alive from a reader. Recorded in memory; flushed by presence."""
+    data = request.get_json(silent=True) or {}
+    device_id = data.get('device_id')
+    if not device_id:
+        return jsonify({'message': 'device_id is required'}), 400
+
+    if not cache.get_device(get_db(), device_id):
+        return jsonify({'message': 'Device not registered', 'device_id': device_id}), 404
+
+    presence.seen(device_id)
+    return jsonify({'status': 'ok'})
+
+
 @devices_bp.route('/<device_id>', methods=['PATCH'])
 def update_device(device_id):
     data = request.get_json()
@@ -69,4 +86,5 @@ def update_device(device_id):
     if not device:
         return jsonify({'message': 'Device not found'}), 404
 
+    cache.devices_by_id.invalidate(device['device_id'])
     return jsonify(serialize_device(device))
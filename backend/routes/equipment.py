@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
+import daily_stats
 
 equipment_bp = Blueprint('equipment', __name__)
 
@@ -48,6 +49,7 @@ def join_queue(equipment_id):
         {'_id': ObjectId(equipment_id)},
         {'$addToSet': {'queue': user_id}}
     )
+    daily_stats.refresh_queues(db)
 
     equip = db.equipment.find_one({'_id': ObjectId(equipment_id)})
     return jsonify(serialize_equipment(equip))
@@ -63,6 +65,7 @@ def leave_queue(equipment_id):
         {'_id': ObjectId(equipment_id)},
         {'$pull': {'queue': user_id}}
     )
+    daily_stats.refresh_queues(db)
 
     equip = db.equipment.find_one({'_id': ObjectId(equipment_id)})
     return jsonify(serialize_equipment(equip))
@@ -1,6 +1,8 @@
 import datetime
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
+import leaderboard
+import response_cache
 
 gamification_bp = Blueprint('gamification', __name__)
 
@@ -50,6 +52,7 @@ def _serialize_entry(user, rank, total_users=None):
 
 
 @gamification_bp.route('/leaderboard', methods=['GET'])
+@response_cache.cached(ttl=5, vary=lambda: (_get_auth_payload() or {}).get('user_id'))
 def get_leaderboard():
     db = get_db()
     period = request.args.get('period', 'all')  # 'all' or 'week'
@@ -75,25 +78,23 @@ def get_leaderboard():
                 e['weekly_taps'] = entry['taps']
                 entries.append(e)
     else:
-        # All-time: rank by total attendance tap count (same logic as weekly, no date filter)
-        pipeline = [
-            {'$match': {'action': 'attendance'}},
-            {'$group': {'_id': '$user_id', 'taps': {'$sum': 1}}},
-            {'$sort': {'taps': -1}},
-            {'$limit': 20},
-        ]
-        all_time = list(db.tap_events.aggregate(pipeline))
-        user_ids = [e['_id'] for e in all_time]
-        users_map = {u['_id']: u for u in db.users.find({'_id': {'$in': user_ids}})}
+        # All-time: rank by total attendance tap count, from the materialized ranking
+        while True:
+            all_time = leaderboard.top(db, 20)
+            user_ids = [ObjectId(user_id) for user_id, _ in all_time]
+            users_map = {u['_id']: u for u in db.users.find({'_id': {'$in': user_ids}})}
+            deleted = [user_id for user_id in user_ids if user_id not in users_map]
+            if not deleted:
+                break
+            # Deleted since the last reload; drop them so the next users move up
+            leaderboard.forget(deleted)
 
         entries = []
-        for rank, entry in enumerate(all_time, 1):
-            u = users_map.get(entry['_id'])
-            if u:
-                e = _serialize_entry(u, rank)
-                e['points'] = entry['taps'] * 10
-                e['weekly_taps'] = entry['taps']
-                entries.append(e)
+        for rank, (user_id, taps) in enumerate(all_time, 1):
+            e = _serialize_entry(users_map[ObjectId(user_id)], rank)
+            e['points'] = taps * 10
+            e['weekly_taps'] = taps
+            entries.append(e)
 
     # Current user's standing
     me = None
@@ -105,20 +106,7 @@ def get_leaderboard():
             if user:
                 total = db.users.count_documents({})
                 if period == 'all':
-                    my_taps = db.tap_events.count_documents({
-                        'user_id': ObjectId(user_id),
-                        'action': 'attendance',
-                    })
-                    ahead = list(db.tap_events.aggregate([
-                        {'$match': {'action': 'attendance'}},
-                        {'$group': {'_id': '$user_id', 'taps': {'$sum': 1}}},
-                        {'$match': {'taps': {'$gt': my_taps}}},
-                        # Only count users that still exist in the users collection
-                        {'$lookup': {'from': 'users', 'localField': '_id', 'foreignField': '_id', 'as': 'u'}},
-                        {'$match': {'u': {'$ne': []}}},
-                        {'$count': 'ahead'},
-                    ]))
-                    rank = (ahead[0]['ahead'] if ahead else 0) + 1
+                    my_taps, rank = leaderboard.standing(db, user_id)
                     user_copy = dict(user)
                     user_copy['points'] = my_taps * 10
                     me = _serialize_entry(user_copy, rank, total_users=total)
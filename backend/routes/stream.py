@@ -1,30 +1,31 @@
-import json
 import queue
-from flask import Blueprint, Response
+from flask import Blueprint, Response, request
+import leaderboard
+import tap_stream as bus
 
 stream_bp = Blueprint('stream', __name__)
 
+KEEPALIVE = b': keepalive\n\n'
 
-@stream_bp.route('/taps')
-def tap_stream():
-    """Server-Sent Events stream for live tap updates."""
-    from app import sse_clients
-
-    q = queue.Queue()
-    sse_clients.append(q)
 
+def _sse(channel, sub):
+    """Stream a subscriber's frames until the client goes away or is evicted."""
     def generate():
         try:
             while True:
                 try:
-                    data = q.get(timeout=30)
-                    yield f"data: {json.dumps(data)}\n\n"
+                    # Frames are encoded once per event and shared by every client
+                    frame = sub.get(timeout=30)
                 except queue.Empty:
                     # Send keepalive comment to prevent timeout
-                    yield ": keepalive\n\n"
-        except GeneratorExit:
-            if q in sse_clients:
-                sse_clients.remove(q)
+                    yield KEEPALIVE
+                    continue
+                if frame is None:
+                    # Evicted as a slow consumer; the browser reconnects and catches up
+                    return
+                yield frame
+        finally:
+            channel.unsubscribe(sub)
 
     return Response(
         generate(),
@@ -35,3 +36,25 @@ def tap_stream():
             'Connection': 'keep-alive',
         }
     )
+
+
+@stream_bp.route('/taps')
+def tap_stream():
+    """Server-Sent Events stream for live tap updates from every worker.
+    A reconnecting EventSource sends Last-Event-ID and gets what it missed.
+    Optional filters: ?action=&device_id=&lecture_id=&society_id=&user_id=
+    (comma-separated values). ?mode=tick&tick=250 batches events per tick.
+    """
+    tick = bus.tick_interval(request.args)
+    sub = bus.taps.subscribe(request.headers.get('Last-Event-ID'),
+                             subscriber=bus.TickSubscriber(tick) if tick else None,
+                             filters=bus.parse_filters(request.args))
+    return _sse(bus.taps, sub)
+
+
+@stream_bp.route('/leaderboard')
+def leaderboard_stream():
+    """Server-Sent Events stream of all-time leaderboard deltas (see leaderboard.py)."""
+    channel = leaderboard.channel
+    sub = channel.subscribe(request.headers.get('Last-Event-ID'))
+    return _sse(channel, sub)
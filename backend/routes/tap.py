@@ -1,26 +1,47 @@
+import base64
+import csv
 import datetime
-from flask import Blueprint, request, jsonify
+import io
+import json
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+import cache
+import daily_stats
+import debounce
+import indexes
+import leaderboard
+import presence
+import response_cache
+import schedule
+import scheduler
+import tap_stream
+import tap_worker
+import tap_writer
+from routes.auth import token_required, SUPERUSER_EMAIL
 
 tap_bp = Blueprint('tap', __name__)
 
+EXPORT_BATCH_SIZE = 1000
+
 
 def get_db():
     from app import db
     return db
 
 
-def broadcast_tap(tap_event):
-    """Push tap event to all SSE clients."""
-    from app import sse_clients
-    dead = []
-    for i, q in enumerate(sse_clients):
-        try:
-            q.put_nowait(tap_event)
-        except Exception:
-            dead.append(i)
-    for i in reversed(dead):
-        sse_clients.pop(i)
+def broadcast_tap(tap_event, event=None, invalidate=True, topics=None):
+    """Push tap event to SSE clients on every worker (see tap_stream.py).
+    event: optional SSE event name; unnamed events reach EventSource.onmessage.
+    invalidate: mark cached dashboard responses stale first, since clients
+    refetch as soon as they see the event. Pass False when the caller has
+    already invalidated for a whole batch.
+    topics: extra values streams can filter on (lecture_id, society_id).
+    """
+    db = get_db()
+    if invalidate:
+        response_cache.invalidate(db)
+    tap_stream.publish(db, tap_event, event, topics)
 
 
 def serialize_tap(tap):
@@ -44,91 +65,8 @@ _TYPE_TO_MODE = {
 }
 
 
-def _update_gamification(db, user, action, is_first_arrival=False):
-    """Award XP, update streaks, and grant badges after each tap."""
-    uid = user['_id']
-    today = datetime.datetime.utcnow().date()
-    pts = 0
-    set_fields = {}
-    badges = []
-
-    if action == 'attendance':
-        pts = 10
-
-        if is_first_arrival:
-            pts += 25
-            if 'early_bird' not in user.get('badges', []):
-                badges.append('early_bird')
-
-        # Streak — only update once per day
-        last_raw = user.get('last_attendance_date')
-        last_date = None
-        if last_raw:
-            last_date = last_raw.date() if isinstance(last_raw, datetime.datetime) else last_raw
-
-        if last_date != today:
-            set_fields['last_attendance_date'] = datetime.datetime.utcnow()
-            new_streak = (
-                user.get('current_streak', 0) + 1
-                if last_date == today - datetime.timedelta(days=1)
-                else 1
-            )
-            set_fields['current_streak'] = new_streak
-            if new_streak > user.get('best_streak', 0):
-                set_fields['best_streak'] = new_streak
-
-            existing = user.get('badges', [])
-            if new_streak >= 3 and 'streak_3' not in existing:
-                badges.append('streak_3')
-                pts += 20
-            if new_streak >= 7 and 'streak_7' not in existing:
-                badges.append('streak_7')
-                pts += 50
-            if new_streak >= 30 and 'streak_30' not in existing:
-                badges.append('streak_30')
-                pts += 200
-
-    elif action == 'event_checkin':
-        pts = 15
-        checkins = db.events.count_documents({'checked_in': uid})
-        if checkins >= 5 and 'society_star' not in user.get('badges', []):
-            badges.append('society_star')
-
-    elif action == 'equipment_checkout':
-        pts = 5
-
-    inc_fields = {}
-    if pts:
-        inc_fields['points'] = pts
-    if is_first_arrival and action == 'attendance':
-        inc_fields['first_arrivals'] = 1
-
-    update = {}
-    if inc_fields:
-        update['$inc'] = inc_fields
-    if set_fields:
-        update['$set'] = set_fields
-    if badges:
-        update['$addToSet'] = {'badges': {'$each': badges}}
-
-    if update:
-        db.users.update_one({'_id': uid}, update)
-
-    # Post-update: century + top_10 badges
-    if pts:
-        refreshed = db.users.find_one({'_id': uid})
-        new_pts = refreshed.get('points', 0)
-        post = []
-        if new_pts >= 100 and 'century' not in refreshed.get('badges', []):
-            post.append('century')
-        rank = db.users.count_documents({'points': {'$gt': new_pts}}) + 1
-        if rank <= 10 and 'top_10' not in refreshed.get('badges', []):
-            post.append('top_10')
-        if post:
-            db.users.update_one({'_id': uid}, {'$addToSet': {'badges': {'$each': post}}})
-
-
-def process_tap_core(device_id: str, card_uid: str, mode_override: str = None):
+def process_tap_core(device_id: str, card_uid: str, mode_override: str = None,
+                     timestamp: datetime.datetime = None, seq: int = None, boot: str = None):
     """Core tap processing logic. Returns (response_dict, status_code).
 
     Looks up user by card_uid, resolves device mode, performs the
@@ -136,94 +74,94 @@ def process_tap_core(device_id: str, card_uid: str, mode_override: str = None):
     tap event, and broadcasts via SSE.
 
     mode_override: if provided, overrides the device's configured mode.
+    timestamp / seq / boot: reader-side tap time, sequence number and boot id,
+    set when the tap arrives through the batch endpoint.
     """
     db = get_db()
 
     # Look up user by card_uid
-    user = db.users.find_one({'card_uid': card_uid})
+    user = cache.get_user_by_card(db, card_uid)
     if not user:
         return {'message': 'Card not registered', 'card_uid': card_uid}, 404
 
     # Look up device
-    device = db.devices.find_one({'device_id': device_id})
+    device = cache.get_device(db, device_id)
     if not device:
         return {'message': 'Device not registered', 'device_id': device_id}, 404
 
-    # Update device last_seen
-    db.devices.update_one(
-        {'_id': device['_id']},
-        {'$set': {'is_online': True, 'last_seen': datetime.datetime.utcnow()}}
-    )
+    presence.seen(device_id)
 
     mode = mode_override if mode_override else device['mode']
     config = device.get('config', {})
     action = None
     context = ''
     is_first_arrival = False
+    topics = {}
+    equipment_update = None
 
     if mode == 'attendance':
         action = 'attendance'
-        lecture_id = config.get('lecture_id')
+        # Current timetable slot from memory; the hand-set config is the fallback
+        lecture_id = scheduler.lecture_id_for(device_id, config, timestamp)
         if lecture_id:
-            lecture = db.lectures.find_one({'_id': ObjectId(lecture_id)})
+            # The pre-image decides first arrival, so two simultaneous taps
+            # cannot both see an empty attendee list
+            lecture = db.lectures.find_one_and_update(
+                {'_id': lecture_id},
+                {'$addToSet': {'attendees': user['_id']}},
+                projection={'name': 1, 'room': 1, 'start_time': 1, 'attendees': {'$slice': 1}},
+            )
             if lecture:
                 is_first_arrival = len(lecture.get('attendees', [])) == 0
+                daily_stats.record_attendees(lecture, [user['_id']])
                 context = f"{lecture['name']} — {lecture['room']}"
-                db.lectures.update_one(
-                    {'_id': ObjectId(lecture_id)},
-                    {'$addToSet': {'attendees': user['_id']}}
-                )
+                topics['lecture_id'] = lecture_id
 
     elif mode == 'equipment':
+        # Only decided here; applied once the tap is stored, so a batch retry
+        # that loses the seq race cannot change the equipment a second time
         equip = db.equipment.find_one({'device_id': device_id})
         if equip:
             context = f"{equip['name']} — {equip['location']}"
             if equip['status'] == 'available' or (equip['status'] == 'in-use' and equip.get('current_user_id') == user['_id']):
                 if equip['status'] == 'available':
                     action = 'equipment_checkout'
-                    db.equipment.update_one(
-                        {'_id': equip['_id']},
-                        {'$set': {'status': 'in-use', 'current_user_id': user['_id'], 'checkout_time': datetime.datetime.utcnow()}}
-                    )
+                    equipment_update = {'$set': {'status': 'in-use', 'current_user_id': user['_id'],
+                                                 'checkout_time': datetime.datetime.utcnow()}}
                 else:
                     action = 'equipment_return'
                     if equip.get('queue') and len(equip['queue']) > 0:
                         next_user = equip['queue'][0]
-                        db.equipment.update_one(
-                            {'_id': equip['_id']},
-                            {'$set': {'current_user_id': next_user, 'checkout_time': datetime.datetime.utcnow()},
-                             '$pop': {'queue': -1}}
-                        )
+                        equipment_update = {'$set': {'current_user_id': next_user,
+                                                     'checkout_time': datetime.datetime.utcnow()},
+                                            '$pop': {'queue': -1}}
                     else:
-                        db.equipment.update_one(
-                            {'_id': equip['_id']},
-                            {'$set': {'status': 'available', 'current_user_id': None, 'checkout_time': None}}
-                        )
+                        equipment_update = {'$set': {'status': 'available', 'current_user_id': None,
+                                                     'checkout_time': None}}
             else:
                 action = 'equipment_checkout'
                 context += ' (queued)'
-                db.equipment.update_one(
-                    {'_id': equip['_id']},
-                    {'$addToSet': {'queue': user['_id']}}
-                )
+                equipment_update = {'$addToSet': {'queue': user['_id']}}
 
     elif mode == 'event':
         event_id = config.get('event_id')
         if event_id:
-            event = db.events.find_one({'_id': ObjectId(event_id)})
+            event_query = {'_id': ObjectId(event_id)}
         else:
             # Fallback: find an event associated with this device_id
-            event = db.events.find_one({'device_id': device_id})
+            event_query = {'device_id': device_id}
+        event = db.events.find_one_and_update(
+            event_query,
+            {'$addToSet': {'checked_in': user['_id']}},
+            projection={'name': 1, 'society_id': 1, 'checked_in': {'$slice': 1}},
+        )
         if event:
             action = 'event_checkin'
             is_first_arrival = len(event.get('checked_in', [])) == 0
-            society = db.societies.find_one({'_id': event['society_id']})
+            topics['society_id'] = event['society_id']
+            society = db.societies.find_one({'_id': event['society_id']}, {'name': 1})
             soc_name = society['name'] if society else 'Unknown'
             context = f"{event['name']} — {soc_name}"
-            db.events.update_one(
-                {'_id': event['_id']},
-                {'$addToSet': {'checked_in': user['_id']}}
-            )
 
     if not action:
         return {'message': 'Could not process tap'}, 400
@@ -239,24 +177,33 @@ def process_tap_core(device_id: str, card_uid: str, mode_override: str = None):
         'device_id': device_id,
         'action': action,
         'context': context,
-        'timestamp': datetime.datetime.utcnow(),
+        'timestamp': timestamp or datetime.datetime.utcnow(),
     }
-
-    result = db.tap_events.insert_one(tap_event)
-    tap_event['_id'] = result.inserted_id
-
-    # Award XP, update streaks, grant badges
-    _update_gamification(db, user, action, is_first_arrival=is_first_arrival)
-
-    # Fetch updated points after gamification
-    updated_user = db.users.find_one({'_id': user['_id']}, {'points': 1})
-    user_points = updated_user.get('points', 0) if updated_user else 0
+    if seq is not None:
+        tap_event['boot'] = boot
+        tap_event['seq'] = seq
+
+    try:
+        tap_event['_id'] = tap_writer.insert(db, tap_event)
+    except DuplicateKeyError:
+        # Only batch taps carry seq: a concurrent retry of the batch stored it first
+        return {'message': 'Duplicate tap', 'seq': seq, 'duplicate': True}, 200
+    if equipment_update:
+        db.equipment.update_one({'_id': equip['_id']}, equipment_update)
+        if '$pop' in equipment_update or '$addToSet' in equipment_update:
+            daily_stats.refresh_queues(db)
+    daily_stats.record([tap_event])
+    leaderboard.record([tap_event])
+
+    # XP, streaks and badges are applied by the tap worker; final points follow over SSE
+    tap_worker.enqueue(db, [tap_worker.make_job(tap_event, is_first_arrival)])
+    user_points = tap_worker.provisional_points(user, action, is_first_arrival)
 
     # Broadcast via SSE
     broadcast_data = serialize_tap({**tap_event})
     broadcast_data['timestamp'] = tap_event['timestamp'].isoformat()
     broadcast_data['is_first_arrival'] = is_first_arrival
-    broadcast_tap(broadcast_data)
+    broadcast_tap(broadcast_data, topics=topics)
 
     response = serialize_tap({
         **tap_event,
@@ -268,75 +215,185 @@ def process_tap_core(device_id: str, card_uid: str, mode_override: str = None):
 
 
 # ─── Tap history endpoint ────────────────────────────
+# Pages are ordered newest first on (timestamp, _id). Each page carries an
+# opaque X-Next-Cursor header; pass it back as ?cursor= for the next page.
 
-@tap_bp.route('/tap-events', methods=['GET'])
-def get_tap_events():
-    """Return recent tap events, newest first."""
-    db = get_db()
-    limit = min(int(request.args.get('limit', 50)), 200)
-    action = request.args.get('action')
-    user_id = request.args.get('user_id')
+HISTORY_FIELDS = ['_id', 'user_id', 'user_name', 'device_id', 'action', 'context', 'timestamp']
+
+
+def serialize_history(e):
+    return {
+        '_id': str(e['_id']),
+        'user_id': str(e['user_id']),
+        'user_name': e['user_name'],
+        'device_id': e['device_id'],
+        'action': e['action'],
+        'context': e['context'],
+        'timestamp': e['timestamp'].isoformat(),
+    }
 
+
+def _parse_time(value):
+    """Parse an ISO date or datetime query arg as naive UTC; None if absent.
+    Raises ValueError.
+    """
+    if not value:
+        return None
+    when = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if when.tzinfo is not None:
+        # Stored timestamps are naive UTC; convert before dropping the offset
+        when = when.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return when
+
+
+def _history_query(args):
+    """Build the tap_events filter from action / user_id / from / to args.
+    from is inclusive, to is exclusive. Raises ValueError on a bad date.
+    """
     query = {}
-    if action:
-        query['action'] = action
-    if user_id:
+    if args.get('action'):
+        query['action'] = args['action']
+    if args.get('user_id'):
         try:
-            query['user_id'] = ObjectId(user_id)
+            query['user_id'] = ObjectId(args['user_id'])
         except Exception:
             pass
+    since, until = _parse_time(args.get('from')), _parse_time(args.get('to'))
+    if since or until:
+        query['timestamp'] = {}
+        if since:
+            query['timestamp']['$gte'] = since
+        if until:
+            query['timestamp']['$lt'] = until
+    return query
+
+
+def _encode_cursor(e):
+    raw = f"{e['timestamp'].isoformat()}|{e['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """Return a filter for everything strictly after the cursor. Raises ValueError."""
+    try:
+        ts, oid = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        ts, oid = datetime.datetime.fromisoformat(ts), ObjectId(oid)
+    except Exception:
+        raise ValueError('invalid cursor')
+    return {'$or': [
+        {'timestamp': {'$lt': ts}},
+        {'timestamp': ts, '_id': {'$lt': oid}},
+    ]}
 
-    events = list(db.tap_events.find(query).sort('timestamp', -1).limit(limit))
-    result = []
-    for e in events:
-        result.append({
-            '_id': str(e['_id']),
-            'user_id': str(e['user_id']),
-            'user_name': e['user_name'],
-            'device_id': e['device_id'],
-            'action': e['action'],
-            'context': e['context'],
-            'timestamp': e['timestamp'].isoformat(),
-        })
-    return jsonify(result)
+
+@tap_bp.route('/tap-events', methods=['GET'])
+@response_cache.cached(ttl=2)
+def get_tap_events():
+    """Return tap events, newest first, one page at a time.
+    Filters: action, user_id, from, to (ISO dates). Paging: limit, cursor.
+    """
+    db = get_db()
+    limit = min(int(request.args.get('limit', 50)), 200)
+
+    try:
+        query = _history_query(request.args)
+        if request.args.get('cursor'):
+            query = {'$and': [query, _decode_cursor(request.args['cursor'])]}
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    events = list(db.tap_events.find(query).sort([('timestamp', -1), ('_id', -1)]).limit(limit))
+    response = jsonify([serialize_history(e) for e in events])
+    if len(events) == limit:
+        response.headers['X-Next-Cursor'] = _encode_cursor(events[-1])
+    return response
+
+
+@tap_bp.route('/tap-events/export', methods=['GET'])
+@token_required
+def export_tap_events(current_user_id=None, current_user_role=None, current_user_email=None):
+    """Stream tap events, oldest first, as NDJSON (default) or CSV (?format=csv).
+    Same filters as /tap-events. Rows go straight from the cursor to the
+    client, so memory use does not grow with the export size.
+    """
+    if current_user_email != SUPERUSER_EMAIL and current_user_role != 'class_admin':
+        return jsonify({'message': 'Forbidden'}), 403
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'message': 'format must be ndjson or csv'}), 400
+    try:
+        query = _history_query(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    cursor = get_db().tap_events.find(query, {f: 1 for f in HISTORY_FIELDS}) \
+        .sort([('timestamp', 1), ('_id', 1)]).batch_size(EXPORT_BATCH_SIZE)
+
+    def ndjson():
+        for e in cursor:
+            yield json.dumps(serialize_history(e)) + '\n'
+
+    def csv_rows():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=HISTORY_FIELDS)
+        writer.writeheader()
+        for i, e in enumerate(cursor, 1):
+            writer.writerow(serialize_history(e))
+            if i % EXPORT_BATCH_SIZE == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    if fmt == 'csv':
+        body, mimetype, ext = csv_rows(), 'text/csv', 'csv'
+    else:
+        body, mimetype, ext = ndjson(), 'application/x-ndjson', 'ndjson'
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=tap-events.{ext}',
+    })
 
 
 # ─── Stats endpoint ──────────────────────────────────
 
 @tap_bp.route('/stats', methods=['GET'])
+@response_cache.cached(ttl=2)
 def get_stats():
     """Return real-time dashboard statistics."""
     db = get_db()
     now = datetime.datetime.utcnow()
     today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    tomorrow = today + datetime.timedelta(days=1)
     next_week = today + datetime.timedelta(days=7)
 
-    taps_today = db.tap_events.count_documents({'timestamp': {'$gte': today, '$lt': tomorrow}})
+    # Taps, students, lecture attendees and queues come from the incrementally
+    # maintained counters; expected students from the in-memory timetable
+    day = daily_stats.get_day(db, today)
+    totals = daily_stats.get_totals(db)
+    timetable = schedule.get()
 
     # Attendance rate scoped to today's lectures; fall back to all-time if none today
-    today_lectures = list(db.lectures.find({'start_time': {'$gte': today, '$lt': tomorrow}}))
-    source_lectures = today_lectures if today_lectures else list(db.lectures.find())
-    total_checked = sum(len(l.get('attendees', [])) for l in source_lectures)
-    total_expected = sum(l.get('expected_students', 0) for l in source_lectures)
+    lectures_today, total_expected = timetable.expected(day['_id'])
+    if lectures_today:
+        total_checked = day.get('lecture_attendees', 0)
+    else:
+        _, total_expected = timetable.expected()
+        total_checked = totals.get('lecture_attendees', 0)
     attendance_rate = round(total_checked / total_expected * 100) if total_expected > 0 else 0
 
-    equipment = list(db.equipment.find())
-    active_queues = sum(1 for e in equipment if e.get('queue'))
-    queue_students = sum(len(e.get('queue', [])) for e in equipment)
+    queues = totals.get('queues', {})
+    active_queues = queues.get('active', 0)
+    queue_students = queues.get('students', 0)
 
     events_this_week = db.events.count_documents({'date': {'$gte': today, '$lt': next_week}})
 
-    # Unique students who tapped today
-    active_students = len(db.tap_events.distinct('user_id', {'timestamp': {'$gte': today, '$lt': tomorrow}}))
-
     return jsonify({
-        'taps_today': taps_today,
+        'taps_today': day.get('taps', 0),
         'attendance_rate': attendance_rate,
         'active_queues': active_queues,
         'queue_students': queue_students,
         'events_this_week': events_this_week,
-        'active_students': active_students,
+        'active_students': day.get('unique_students', 0),
     })
 
 
@@ -369,26 +426,29 @@ def nfc_event():
     mode_override = _TYPE_TO_MODE.get(raw_type) if raw_type else None
 
     if device_id:
-        result, status = process_tap_core(device_id, card_uid, mode_override=mode_override)
-        return jsonify(result), status
+        result, status = debounce.run(
+            get_db(), device_id, card_uid,
+            lambda: process_tap_core(device_id, card_uid, mode_override=mode_override))
+    else:
+        result, status = debounce.run(get_db(), None, card_uid, lambda: _process_legacy_tap(card_uid))
+    return jsonify(result), status
 
-    # Legacy fallback: no device_id — find the live lecture by time
+
+def _process_legacy_tap(card_uid):
+    """Legacy fallback for readers that send no device_id: find the live
+    lecture by time. Returns (response_dict, status_code).
+    """
     db = get_db()
-    user = db.users.find_one({'card_uid': card_uid})
+    user = cache.get_user_by_card(db, card_uid)
     if not user:
-        return jsonify({'message': 'Card not registered', 'card_uid': card_uid}), 404
+        return {'message': 'Card not registered', 'card_uid': card_uid}, 404
 
     now = datetime.datetime.utcnow()
-    lecture = db.lectures.find_one({
-        'start_time': {'$lte': now + datetime.timedelta(minutes=15)},
-        'end_time': {'$gte': now},
-    })
+    timetable = schedule.get()
+    lecture = timetable.live(now, lead=datetime.timedelta(minutes=15))
     if not lecture:
         today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        lecture = db.lectures.find_one(
-            {'start_time': {'$gte': today}},
-            sort=[('start_time', 1)]
-        )
+        lecture = timetable.next_after(today)
 
     resolved_device_id = 'ESP32'
     context = ''
@@ -400,6 +460,7 @@ def nfc_event():
             {'_id': lecture['_id']},
             {'$addToSet': {'attendees': user['_id']}}
         )
+        daily_stats.record_attendees(lecture, [user['_id']])
 
     tap_event = {
         'user_id': user['_id'],
@@ -410,17 +471,346 @@ def nfc_event():
         'timestamp': datetime.datetime.utcnow(),
     }
 
-    result = db.tap_events.insert_one(tap_event)
-    tap_event['_id'] = result.inserted_id
+    tap_event['_id'] = tap_writer.insert(db, tap_event)
+    daily_stats.record([tap_event])
+    leaderboard.record([tap_event])
 
     broadcast_data = serialize_tap({**tap_event})
     broadcast_data['timestamp'] = tap_event['timestamp'].isoformat()
-    broadcast_tap(broadcast_data)
+    broadcast_tap(broadcast_data, topics={'lecture_id': lecture['_id'] if lecture else None})
 
-    return jsonify(serialize_tap({
+    return serialize_tap({
         **tap_event,
         'timestamp': tap_event['timestamp'].isoformat(),
-    })), 201
+    }), 201
+
+
+# ─── ESP32 batch endpoint ────────────────────────────
+# Receives: { "device_id": "UNITAP-001", "boot": "8f3a61c2",
+#             "taps": [{ "uid": "27:9A:99:54", "ts": 1739999999, "seq": 42 }, ...] }
+# Readers buffer taps (offline, or during a burst at lecture changeover) and
+# flush them in one request. seq is a per-device counter and boot identifies
+# the run of that counter: a reader picks a new boot id (e.g. random at
+# power-on) whenever seq restarts, so taps after a reboot or reflash are not
+# mistaken for old ones. The unique (device_id, boot, seq) index on tap_events
+# makes a retried batch a no-op.
+
+MAX_BATCH_TAPS = 500
+
+
+def _tap_time(ts, now):
+    """Convert a reader's unix timestamp to a UTC datetime.
+    Falls back to now for missing values, readers that have not synced NTP
+    yet (ts near 0), and timestamps from the future.
+    """
+    try:
+        when = datetime.datetime.utcfromtimestamp(int(ts))
+    except (TypeError, ValueError, OverflowError, OSError):
+        return now
+    if when.year < 2020 or when > now + datetime.timedelta(minutes=5):
+        return now
+    return when
+
+
+def _boot_id(value):
+    """A reader boot id as a string, or None if missing or malformed."""
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        return None
+    value = str(value)
+    return value if 0 < len(value) <= 64 else None
+
+
+def process_tap_batch(raw_taps, default_device_id=None, default_boot=None):
+    """Bulk counterpart of process_tap_core for buffered reader uploads.
+
+    Resolves all users, devices, lectures and events with one query each,
+    stores the taps with a single unordered insert_many, then applies
+    attendee / check-in updates with one atomic update per lecture or event
+    and hands XP to the tap worker.
+    Equipment taps depend on the order of checkouts and returns, so they
+    are handed to process_tap_core one at a time.
+
+    Returns a list of (response_dict, status_code), one per input tap.
+    """
+    db = get_db()
+    now = datetime.datetime.utcnow()
+    results = [None] * len(raw_taps)
+    taps = []
+    seen = set()
+
+    for i, raw in enumerate(raw_taps):
+        if not isinstance(raw, dict):
+            results[i] = {'message': 'tap must be an object'}, 400
+            continue
+        device_id = raw.get('device_id') or default_device_id
+        seq = raw.get('seq')
+        boot = _boot_id(raw.get('boot', default_boot))
+        if not raw.get('uid') or not device_id:
+            results[i] = {'message': 'uid and device_id required', 'seq': seq}, 400
+            continue
+        if seq is not None and (not isinstance(seq, int) or isinstance(seq, bool)):
+            results[i] = {'message': 'seq must be an integer', 'seq': seq}, 400
+            continue
+        if seq is not None:
+            if boot is None:
+                results[i] = {'message': 'seq requires a boot id', 'seq': seq}, 400
+                continue
+            if (device_id, boot, seq) in seen:
+                results[i] = {'message': 'Duplicate tap', 'seq': seq, 'duplicate': True}, 200
+                continue
+            seen.add((device_id, boot, seq))
+
+        raw_type = raw.get('type', '')
+        taps.append({
+            'index': i,
+            'card_uid': normalize_uid(raw['uid']),
+            'device_id': device_id,
+            'seq': seq,
+            'boot': boot,
+            'mode_override': _TYPE_TO_MODE.get(raw_type) if raw_type else None,
+            'timestamp': _tap_time(raw.get('ts'), now),
+        })
+
+    # Drop taps already stored by an earlier attempt of this batch
+    seqs_by_run = {}
+    for t in taps:
+        if t['seq'] is not None:
+            seqs_by_run.setdefault((t['device_id'], t['boot']), []).append(t['seq'])
+    if seqs_by_run:
+        stored = {
+            (e['device_id'], e.get('boot'), e['seq'])
+            for e in db.tap_events.find(
+                {'$or': [{'device_id': d, 'boot': b, 'seq': {'$in': s}} for (d, b), s in seqs_by_run.items()]},
+                {'device_id': 1, 'boot': 1, 'seq': 1},
+            )
+        }
+        fresh = []
+        for t in taps:
+            if (t['device_id'], t['boot'], t['seq']) in stored:
+                results[t['index']] = {'message': 'Duplicate tap', 'seq': t['seq'], 'duplicate': True}, 200
+            else:
+                fresh.append(t)
+        taps = fresh
+
+    users = {u['card_uid']: u for u in db.users.find(
+        {'card_uid': {'$in': list({t['card_uid'] for t in taps})}}, cache.USER_FIELDS
+    )}
+    devices = {d['device_id']: d for d in db.devices.find({'device_id': {'$in': list({t['device_id'] for t in taps})}})}
+
+    lecture_ids, event_ids, event_devices = set(), set(), set()
+    bulk_taps, sequential_taps = [], []
+    for t in taps:
+        user = users.get(t['card_uid'])
+        if not user:
+            results[t['index']] = {'message': 'Card not registered', 'card_uid': t['card_uid'], 'seq': t['seq']}, 404
+            continue
+        device = devices.get(t['device_id'])
+        if not device:
+            results[t['index']] = {'message': 'Device not registered', 'device_id': t['device_id'], 'seq': t['seq']}, 404
+            continue
+
+        t['user'] = user
+        t['device'] = device
+        t['mode'] = t['mode_override'] or device['mode']
+        config = device.get('config', {})
+        if t['mode'] == 'equipment':
+            sequential_taps.append(t)
+            continue
+        if t['mode'] == 'attendance':
+            # Resolved at the reader's tap time, so buffered taps land on the right slot
+            t['lecture_id'] = scheduler.lecture_id_for(t['device_id'], config, t['timestamp'])
+            if t['lecture_id']:
+                lecture_ids.add(t['lecture_id'])
+        elif t['mode'] == 'event':
+            if config.get('event_id'):
+                event_ids.add(ObjectId(config['event_id']))
+            else:
+                event_devices.add(t['device_id'])
+        bulk_taps.append(t)
+
+    lectures = {}
+    if lecture_ids:
+        lectures = {l['_id']: l for l in db.lectures.find(
+            {'_id': {'$in': list(lecture_ids)}},
+            {'name': 1, 'room': 1, 'start_time': 1},
+        )}
+
+    events, events_by_device = {}, {}
+    if event_ids or event_devices:
+        for e in db.events.find(
+            {'$or': [{'_id': {'$in': list(event_ids)}}, {'device_id': {'$in': list(event_devices)}}]},
+            {'name': 1, 'society_id': 1, 'device_id': 1},
+        ):
+            events[e['_id']] = e
+            events_by_device.setdefault(e.get('device_id'), e)
+    society_names = {}
+    if events:
+        society_names = {s['_id']: s['name'] for s in db.societies.find(
+            {'_id': {'$in': list({e['society_id'] for e in events.values()})}}, {'name': 1}
+        )}
+
+    # Build tap documents in upload order
+    ready = []
+    for t in bulk_taps:
+        config = t['device'].get('config', {})
+        action = None
+        context = ''
+        t['lecture'] = t['event'] = None
+        if t['mode'] == 'attendance':
+            action = 'attendance'
+            lecture = lectures.get(t['lecture_id'])
+            if lecture:
+                t['lecture'] = lecture
+                context = f"{lecture['name']} — {lecture['room']}"
+        elif t['mode'] == 'event':
+            if config.get('event_id'):
+                event = events.get(ObjectId(config['event_id']))
+            else:
+                event = events_by_device.get(t['device_id'])
+            if event:
+                action = 'event_checkin'
+                t['event'] = event
+                soc_name = society_names.get(event['society_id'], 'Unknown')
+                context = f"{event['name']} — {soc_name}"
+
+        if not action:
+            results[t['index']] = {'message': 'Could not process tap', 'seq': t['seq']}, 400
+            continue
+
+        t['doc'] = {
+            'user_id': t['user']['_id'],
+            'user_name': t['user']['name'],
+            'device_id': t['device_id'],
+            'action': action,
+            'context': context or t['device'].get('location', t['device_id']),
+            'timestamp': t['timestamp'],
+        }
+        if t['seq'] is not None:
+            t['doc']['boot'] = t['boot']
+            t['doc']['seq'] = t['seq']
+        ready.append(t)
+
+    for device_id in devices:
+        presence.seen(device_id, now)
+
+    # Store taps; a duplicate key here means a concurrent retry won the race
+    stored = []
+    if ready:
+        failed = set()
+        try:
+            db.tap_events.insert_many([t['doc'] for t in ready], ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get('writeErrors', []):
+                if err.get('code') != 11000:
+                    raise
+                failed.add(err['index'])
+        for i, t in enumerate(ready):
+            if i in failed:
+                results[t['index']] = {'message': 'Duplicate tap', 'seq': t['seq'], 'duplicate': True}, 200
+            else:
+                stored.append(t)
+        daily_stats.record([t['doc'] for t in stored])
+        leaderboard.record([t['doc'] for t in stored])
+
+    # Attendee / check-in lists, one update per lecture or event. As in
+    # process_tap_core the pre-image decides first arrival, so a concurrent
+    # tap cannot also see the list empty; the batch's first tap there gets it.
+    new_attendees, new_checkins = {}, {}
+    for t in stored:
+        if t['lecture']:
+            new_attendees.setdefault(t['lecture']['_id'], []).append(t)
+        elif t['event']:
+            new_checkins.setdefault(t['event']['_id'], []).append(t)
+    for collection, field, grouped in ((db.lectures, 'attendees', new_attendees),
+                                       (db.events, 'checked_in', new_checkins)):
+        for doc_id, group in grouped.items():
+            before = collection.find_one_and_update(
+                {'_id': doc_id},
+                {'$addToSet': {field: {'$each': [t['user']['_id'] for t in group]}}},
+                projection={field: {'$slice': 1}},
+            )
+            if before is not None and not before.get(field):
+                group[0]['is_first_arrival'] = True
+    for group in new_attendees.values():
+        daily_stats.record_attendees(group[0]['lecture'], [t['user']['_id'] for t in group])
+
+    # XP, streaks and badges go to the tap worker, which coalesces them per user
+    tap_worker.enqueue(db, [tap_worker.make_job(t['doc'], t.get('is_first_arrival', False)) for t in stored])
+    running = {}
+    for t in stored:
+        user = {'points': running.get(t['user']['_id'], t['user'].get('points', 0))}
+        t['points'] = running[t['user']['_id']] = tap_worker.provisional_points(
+            user, t['doc']['action'], t.get('is_first_arrival', False)
+        )
+
+    if stored:
+        response_cache.invalidate(db)
+    for t in stored:
+        tap_event = t['doc']
+        is_first_arrival = t.get('is_first_arrival', False)
+
+        broadcast_data = serialize_tap({**tap_event})
+        broadcast_data['timestamp'] = tap_event['timestamp'].isoformat()
+        broadcast_data['is_first_arrival'] = is_first_arrival
+        broadcast_tap(broadcast_data, invalidate=False, topics={
+            'lecture_id': t['lecture']['_id'] if t['lecture'] else None,
+            'society_id': t['event']['society_id'] if t['event'] else None,
+        })
+
+        response = serialize_tap({
+            **tap_event,
+            'timestamp': tap_event['timestamp'].isoformat(),
+        })
+        response['is_first_arrival'] = is_first_arrival
+        response['points'] = t['points']
+        results[t['index']] = response, 201
+
+    for t in sequential_taps:
+        result, status = process_tap_core(
+            t['device_id'], t['card_uid'], mode_override=t['mode_override'],
+            timestamp=t['timestamp'], seq=t['seq'], boot=t['boot'],
+        )
+        if status != 201:
+            result['seq'] = t['seq']
+        results[t['index']] = result, status
+
+    return results
+
+
+@tap_bp.route('/nfc-events/batch', methods=['POST'])
+def nfc_event_batch():
+    """Batched ESP32 tap endpoint.
+    Accepts { "device_id": "UNITAP-001", "boot": "...", "taps": [...] } or a
+    bare array of taps, each { "uid", "device_id", "boot", "ts", "seq" } (a
+    tap's device_id and boot default to the top-level ones; seq needs a boot).
+    Returns one result per tap, in order; retried taps come back with
+    "duplicate": true and are not applied twice.
+    """
+    data = request.get_json()
+    if isinstance(data, list):
+        raw_taps, device_id, boot = data, None, None
+    else:
+        data = data or {}
+        raw_taps, device_id, boot = data.get('taps'), data.get('device_id'), data.get('boot')
+
+    if not isinstance(raw_taps, list) or not raw_taps:
+        return jsonify({'message': 'taps array required'}), 400
+    if len(raw_taps) > MAX_BATCH_TAPS:
+        return jsonify({'message': f'At most {MAX_BATCH_TAPS} taps per batch'}), 400
+
+    # Retries are only idempotent with the unique seq index in place
+    indexes.ensure_required(get_db())
+    results = process_tap_batch(raw_taps, default_device_id=device_id, default_boot=boot)
+
+    response = []
+    for result, status in results:
+        response.append({**result, 'status': status})
+    return jsonify({
+        'results': response,
+        'processed': sum(1 for _, status in results if status == 201),
+        'duplicates': sum(1 for result, _ in results if result.get('duplicate')),
+        'failed': sum(1 for _, status in results if status >= 400),
+    }), 200
 
 
 # ─── Original tap endpoint (frontend / generic) ─────
@@ -440,11 +830,26 @@ def process_tap():
     # Normalize in case it comes with separators
     card_uid = normalize_uid(card_uid)
 
-    result, status = process_tap_core(device_id, card_uid, mode_override=mode_override)
+    result, status = debounce.run(
+        get_db(), device_id, card_uid,
+        lambda: process_tap_core(device_id, card_uid, mode_override=mode_override))
     return jsonify(result), status
 
 
 # ─── Demo simulate endpoint ─────────────────────────
+# Device ids and card UIDs to pick from, reloaded every 30s rather than per call
+_simulate_pools = cache.TTLCache(2, 30)
+
+
+def _simulate_pool(name, load):
+    pool = _simulate_pools.get(name)
+    if not pool:
+        pool = load()
+        if pool:
+            _simulate_pools.set(name, pool)
+    return pool
+
+
 @tap_bp.route('/tap/simulate', methods=['POST'])
 def simulate_tap():
     """Demo endpoint: simulate a tap without real hardware.
@@ -462,19 +867,21 @@ def simulate_tap():
     if not device_id:
         # Pick a random device that has a non-empty config (attendance/event devices)
         # so we get varied contexts across different rooms
-        devices = list(db.devices.find({'config': {'$ne': {}}, 'is_online': True}))
-        if not devices:
-            devices = list(db.devices.find())
+        devices = _simulate_pool('devices', lambda: [
+            d['device_id'] for d in db.devices.find({'config': {'$ne': {}}, 'is_online': True}, {'device_id': 1})
+        ] or [d['device_id'] for d in db.devices.find({}, {'device_id': 1})])
         if not devices:
             return jsonify({'message': 'No devices registered. Seed the database first.'}), 400
-        device_id = random.choice(devices)['device_id']
+        device_id = random.choice(devices)
 
     if not card_uid:
         # Pick a random user with a linked card
-        users_with_cards = list(db.users.find({'card_uid': {'$nin': [None, '']}}))
-        if not users_with_cards:
+        cards = _simulate_pool('cards', lambda: [
+            u['card_uid'] for u in db.users.find({'card_uid': {'$nin': [None, '']}}, {'card_uid': 1})
+        ])
+        if not cards:
             return jsonify({'message': 'No users with linked cards. Seed the database first.'}), 400
-        card_uid = random.choice(users_with_cards)['card_uid']
+        card_uid = random.choice(cards)
 
     result, status = process_tap_core(device_id, card_uid)
     return jsonify(result), status
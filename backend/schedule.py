@@ -0,0 +1,177 @@
+"""In-memory lecture timetable for resolving taps by time.
+
+Each worker keeps every lecture's time slot (not its attendee list) sorted by
+start time, overall and per device and room. "Which lecture is live here
+now?" is a binary search plus a short walk back, so taps that are resolved
+by time never query the lectures collection.
+
+The index is reloaded every SCHEDULE_REFRESH seconds by a background thread.
+Code in this process that changes the timetable calls refresh(db) to reload
+it immediately. Other workers see the change at their next reload.
+
+The index also sums expected students per day, for the dashboard's
+attendance rate.
+"""
+
+import bisect
+import datetime
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+SCHEDULE_REFRESH = float(os.getenv('SCHEDULE_REFRESH', '60'))
+
+# Only what time-based resolution and the expected-student sums need;
+# attendee arrays stay in MongoDB
+SLOT_FIELDS = {'name': 1, 'room': 1, 'device_id': 1, 'start_time': 1, 'end_time': 1, 'expected_students': 1}
+
+
+class Timeline:
+    """Intervals sorted by start, with a running max of end times so a
+    stabbing query can stop walking back as soon as nothing earlier can
+    still be running.
+    """
+
+    def __init__(self, lectures):
+        self.lectures = sorted(lectures, key=lambda l: (l['start_time'], l['_id']))
+        self.starts = [l['start_time'] for l in self.lectures]
+        self.max_end = []
+        latest = None
+        for l in self.lectures:
+            latest = l['end_time'] if latest is None else max(latest, l['end_time'])
+            self.max_end.append(latest)
+
+    def live(self, when, lead=datetime.timedelta(0)):
+        """Lectures with start_time <= when + lead and end_time >= when, earliest first."""
+        found = []
+        i = bisect.bisect_right(self.starts, when + lead) - 1
+        while i >= 0 and self.max_end[i] >= when:
+            if self.lectures[i]['end_time'] >= when:
+                found.append(self.lectures[i])
+            i -= 1
+        found.reverse()
+        return found
+
+    def next_after(self, when):
+        """First lecture starting at or after when, or None."""
+        i = bisect.bisect_left(self.starts, when)
+        return self.lectures[i] if i < len(self.lectures) else None
+
+
+class ScheduleIndex:
+    def __init__(self, lectures=()):
+        lectures = list(lectures)
+        self.all = Timeline(lectures)
+        by_device, by_room = {}, {}
+        self.expected_by_day = {}  # 'YYYY-MM-DD' -> [lectures, expected students]
+        for l in lectures:
+            day = self.expected_by_day.setdefault(l['start_time'].strftime('%Y-%m-%d'), [0, 0])
+            day[0] += 1
+            day[1] += l.get('expected_students') or 0
+            if l.get('device_id'):
+                by_device.setdefault(l['device_id'], []).append(l)
+            if l.get('room'):
+                by_room.setdefault(l['room'], []).append(l)
+        self.expected_total = (len(lectures), sum(e for _, e in self.expected_by_day.values()))
+        self.by_device = {k: Timeline(v) for k, v in by_device.items()}
+        self.by_room = {k: Timeline(v) for k, v in by_room.items()}
+        self.loaded_at = time.time()
+
+    def live(self, when, lead=datetime.timedelta(0), device_id=None, room=None):
+        """First live lecture, optionally for one device or room, or None."""
+        if device_id is not None:
+            timeline = self.by_device.get(device_id)
+        elif room is not None:
+            timeline = self.by_room.get(room)
+        else:
+            timeline = self.all
+        found = timeline.live(when, lead) if timeline else []
+        return found[0] if found else None
+
+    def next_after(self, when):
+        return self.all.next_after(when)
+
+    def expected(self, day=None):
+        """(lectures, expected students) starting on day ('YYYY-MM-DD'), or in total."""
+        if day is None:
+            return self.expected_total
+        return tuple(self.expected_by_day.get(day, (0, 0)))
+
+
+def status_at(lecture, when):
+    """Status of a lecture at a moment; matches status_query."""
+    if when < lecture['start_time']:
+        return 'upcoming'
+    if when > lecture['end_time']:
+        return 'ended'
+    return 'live'
+
+
+def status_query(status, when):
+    """MongoDB conditions on start_time/end_time for lectures with this status
+    ('upcoming', 'live', 'ended') at when, or None for an unknown status.
+    """
+    if status == 'upcoming':
+        return {'start_time': {'$gt': when}}
+    if status == 'live':
+        return {'start_time': {'$lte': when}, 'end_time': {'$gte': when}}
+    if status == 'ended':
+        return {'end_time': {'$lt': when}}
+    return None
+
+
+_index = ScheduleIndex()
+_thread = None
+_stats = {'reloads': 0, 'errors': 0}
+
+
+def refresh(db):
+    """Reload the timetable from MongoDB."""
+    global _index
+    lectures = db.lectures.find(
+        {'start_time': {'$ne': None}, 'end_time': {'$ne': None}}, SLOT_FIELDS,
+    )
+    _index = ScheduleIndex(lectures)
+    _stats['reloads'] += 1
+    return _index
+
+
+def get():
+    """The current index. Callers should hold on to it for one request."""
+    return _index
+
+
+def _loop(db):
+    while True:
+        time.sleep(SCHEDULE_REFRESH)
+        try:
+            refresh(db)
+        except Exception:
+            _stats['errors'] += 1
+            log.exception('schedule reload failed')
+
+
+def start(db):
+    """Load the timetable and keep it fresh (once per process)."""
+    global _thread
+    if _thread is not None:
+        return
+    try:
+        refresh(db)
+    except Exception:
+        _stats['errors'] += 1
+        log.exception('initial schedule load failed')
+    _thread = threading.Thread(target=_loop, args=(db,), name='schedule', daemon=True)
+    _thread.start()
+
+
+def stats():
+    return {
+        **_stats,
+        'lectures': len(_index.all.lectures),
+        'age_s': round(time.time() - _index.loaded_at, 1),
+        'refresh_interval': SCHEDULE_REFRESH,
+    }
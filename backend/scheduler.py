@@ -0,0 +1,104 @@
+"""Timetable-driven device → lecture assignment.
+
+A reader's config.lecture_id used to be set by hand and went stale as soon as
+the next lecture in its room started. Now the tap path asks lecture_id_for(),
+which picks the device's current timetable slot from the in-memory schedule
+index (schedule.py), so it needs no query. A slot counts from
+SCHEDULE_ASSIGN_LEAD_MIN minutes before it starts, for early arrivals. The
+hand-set config.lecture_id is only a fallback for devices with no lecture in
+the timetable.
+
+A background thread also writes the current slot into each attendance
+device's config every SCHEDULER_INTERVAL seconds, so the devices page shows
+the real assignment. Only devices whose slot changed are written, and the
+conditional update makes concurrent syncs from several workers harmless.
+"""
+
+import datetime
+import logging
+import os
+import threading
+import time
+from bson import ObjectId
+from pymongo import UpdateOne
+import cache
+import schedule
+
+log = logging.getLogger(__name__)
+
+SCHEDULE_ASSIGN_LEAD = datetime.timedelta(minutes=float(os.getenv('SCHEDULE_ASSIGN_LEAD_MIN', '15')))
+SCHEDULER_INTERVAL = float(os.getenv('SCHEDULER_INTERVAL', '30'))
+
+_thread = None
+_stats = {'syncs': 0, 'reassigned': 0, 'errors': 0}
+
+
+def current_lecture(device_id, when=None):
+    """The timetable slot for a device at when (default now), or None. Memory only."""
+    return schedule.get().live(when or datetime.datetime.utcnow(), lead=SCHEDULE_ASSIGN_LEAD, device_id=device_id)
+
+
+def lecture_id_for(device_id, config, when=None):
+    """ObjectId of the lecture a tap on this device counts towards, or None."""
+    slot = current_lecture(device_id, when)
+    if slot:
+        return slot['_id']
+    if config.get('lecture_id'):
+        return ObjectId(config['lecture_id'])
+    return None
+
+
+def sync_devices(db, now=None):
+    """Point each attendance device's config.lecture_id at its current slot.
+    Returns the device_ids that were reassigned.
+    """
+    now = now or datetime.datetime.utcnow()
+    timetable = schedule.get()
+    if not timetable.by_device:
+        return []
+
+    ops, changed = [], []
+    for device in db.devices.find(
+        {'mode': 'attendance', 'device_id': {'$in': list(timetable.by_device)}},
+        {'device_id': 1, 'config': 1},
+    ):
+        slot = timetable.live(now, lead=SCHEDULE_ASSIGN_LEAD, device_id=device['device_id'])
+        if not slot:
+            continue
+        lecture_id = str(slot['_id'])
+        if (device.get('config') or {}).get('lecture_id') != lecture_id:
+            ops.append(UpdateOne(
+                {'_id': device['_id'], 'config.lecture_id': {'$ne': lecture_id}},
+                {'$set': {'config.lecture_id': lecture_id}},
+            ))
+            changed.append(device['device_id'])
+
+    if ops:
+        db.devices.bulk_write(ops, ordered=False)
+        cache.devices_by_id.invalidate(*changed)
+    _stats['syncs'] += 1
+    _stats['reassigned'] += len(changed)
+    return changed
+
+
+def _loop(db):
+    while True:
+        try:
+            sync_devices(db)
+        except Exception:
+            _stats['errors'] += 1
+            log.exception('device assignment sync failed')
+        time.sleep(SCHEDULER_INTERVAL)
+
+
+def start(db):
+    """Start this process's assignment thread (once)."""
+    global _thread
+    if _thread is not None:
+        return
+    _thread = threading.Thread(target=_loop, args=(db,), name='scheduler', daemon=True)
+    _thread.start()
+
+
+def stats():
+    return {**_stats, 'interval': SCHEDULER_INTERVAL, 'lead_min': SCHEDULE_ASSIGN_LEAD.total_seconds() / 60}
@@ -3,12 +3,15 @@
 import datetime
 import bcrypt
 from pymongo import MongoClient
+import daily_stats
+import indexes
+import leaderboard
 
 client = MongoClient('mongodb://localhost:27017')
 db = client['unitap']
 
 # Clear existing data
-for col in ['users', 'devices', 'lectures', 'equipment', 'societies', 'events', 'tap_events', 'pending_verifications']:
+for col in ['users', 'devices', 'lectures', 'equipment', 'societies', 'events', 'tap_events', 'pending_verifications', 'daily_stats', 'daily_students', 'lecture_attendees', 'leaderboard_counts']:
     db[col].drop()
 
 print('Cleared existing data.')
@@ -262,11 +265,14 @@ db.tap_events.insert_many(tap_events_data)
 print(f'Inserted {len(tap_events_data)} tap events.')
 
 # Create indexes
-db.users.create_index('email', unique=True)
-db.users.create_index('card_uid')
-db.devices.create_index('device_id', unique=True)
-db.tap_events.create_index('timestamp')
-db.tap_events.create_index('user_id')
+indexes.build(db)
+
+# Dashboard counters for the seeded taps
+daily_stats.rebuild(db, daily_stats.day_key(today))
+daily_stats.rebuild_totals(db)
+
+# All-time leaderboard counts
+leaderboard.rebuild(db)
 
 print('\nDone! Database seeded successfully.')
 print(f'\nDemo credentials:')
@@ -0,0 +1,405 @@
+"""Generate a production-sized synthetic dataset (seed.py is the small demo set).
+
+    python seed_large.py                                  # 100k users, 10M taps into unitap_large
+    python seed_large.py --users 20000 --taps 1000000 --workers 4
+    python seed_large.py --db unitap_bench_m --taps 100000 --seed 7
+
+Generates a term of --days days around today. Lectures run on weekdays in
+hourly slots across --rooms rooms, each room with its own attendance reader.
+Society events run in the evenings. Taps cluster a few minutes around each
+start. Students differ in engagement, so the leaderboard has a long tail.
+Only sessions that have already started get attendees and taps.
+
+The output is fully determined by --seed, --now and the size arguments. Every _id
+is derived from the entity index, and each unit of work uses its own seeded
+RNG, so the result does not depend on --workers or on scheduling. Users,
+lectures and events are written by a process pool with batched
+insert_many(ordered=False). Indexes are built afterwards, as are
+leaderboard_counts and each past day's daily_stats. The target database is
+dropped first.
+"""
+
+import argparse
+import datetime
+import itertools
+import os
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+import daily_stats
+import indexes
+import leaderboard
+
+COLLECTIONS = ['users', 'devices', 'lectures', 'equipment', 'societies', 'events', 'tap_events',
+               'tap_jobs', 'daily_stats', 'daily_students', 'lecture_attendees', 'leaderboard_counts',
+               'response_cache', 'tap_debounce', 'pending_verifications']
+
+FIRST_NAMES = ['Aisha', 'Ben', 'Chloe', 'Daniel', 'Emily', 'Farah', 'George', 'Hannah', 'Ibrahim', 'Jess',
+               'Kai', 'Lily', 'Mohammed', 'Nina', 'Oliver', 'Priya', 'Qasim', 'Rosie', 'Sam', 'Tara',
+               'Umar', 'Victoria', 'Will', 'Xin', 'Yusuf', 'Zara']
+LAST_NAMES = ['Ahmed', 'Brown', 'Chen', 'Davies', 'Evans', 'Fernandes', 'Green', 'Hughes', 'Iqbal', 'Jones',
+              'Khan', 'Lewis', 'Murphy', 'Nguyen', 'Okafor', 'Patel', 'Roberts', 'Smith', 'Taylor', 'Wang',
+              'Williams', 'Wilson', 'Wright', 'Young']
+SUBJECTS = ['Database Systems', 'Machine Learning', 'Computer Networks', 'Software Engineering', 'Algorithms',
+            'Operating Systems', 'Linear Algebra', 'Statistics', 'Compilers', 'Distributed Systems',
+            'Computer Vision', 'Cryptography', 'Human-Computer Interaction', 'Robotics', 'Data Mining']
+BUILDINGS = ['Bush House', 'Strand Building', 'Waterloo FWB', 'Guy\'s Campus', 'Denmark Hill']
+
+# Kinds are baked into the generated ObjectIds so ids never collide
+KIND_USER, KIND_LECTURE, KIND_EVENT, KIND_SOCIETY, KIND_TAP = 1, 2, 3, 4, 5
+UNIT_SIZE = 25  # lectures or events per unit of work
+INSERT_BATCH = 10000
+
+
+def oid(kind, index, when):
+    """Deterministic ObjectId: creation time, kind byte, 7-byte index."""
+    return ObjectId(struct.pack('>I', int(when.replace(tzinfo=datetime.timezone.utc).timestamp()))
+                    + bytes([kind]) + index.to_bytes(7, 'big'))
+
+
+def user_name(i):
+    return f'{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]}'
+
+
+def card_uid(i):
+    # An odd multiplier is a bijection mod 2**32, so cards are unique but look random
+    return f'{(i * 2654435761 + 0x5EED) % 2 ** 32:08X}'
+
+
+# ─── Worker process state ────────────────────────────
+
+_db = None
+_plan = None
+_cum_weights = None
+
+
+def _init_worker(uri, db_name, plan):
+    global _db, _plan, _cum_weights
+    _db = MongoClient(uri)[db_name]
+    _plan = plan
+    # Per-student engagement: most attend often, a long tail rarely shows up
+    rng = random.Random(f"{plan['seed']}:engagement")
+    _cum_weights = list(itertools.accumulate(rng.betavariate(2, 3) for _ in range(plan['users'])))
+
+
+def _pick_students(rng, k):
+    """k distinct user indexes, weighted by engagement."""
+    n = _plan['users']
+    k = min(k, n)
+    if k > n // 2:
+        return rng.sample(range(n), k)
+    chosen = set()
+    while len(chosen) < k:
+        chosen.update(rng.choices(range(n), cum_weights=_cum_weights, k=k - len(chosen)))
+    return list(chosen)[:k]
+
+
+def _insert(coll, docs):
+    for i in range(0, len(docs), INSERT_BATCH):
+        _db[coll].insert_many(docs[i:i + INSERT_BATCH], ordered=False)
+
+
+def _user_oid(i):
+    return oid(KIND_USER, i, _plan['term_start'])
+
+
+def make_users(unit):
+    """Insert one chunk of users."""
+    start = unit * INSERT_BATCH
+    stop = min(start + INSERT_BATCH, _plan['users'])
+    created = _plan['term_start'] - datetime.timedelta(days=30)
+    _insert('users', [{
+        '_id': _user_oid(i),
+        'email': f'student{i}@kcl.ac.uk',
+        'name': user_name(i),
+        'password_hash': _plan['password_hash'],
+        'card_uid': card_uid(i),
+        'role': 'student',
+        'university': 'KCL',
+        'points': 0,
+        'created_at': created,
+    } for i in range(start, stop)])
+    return stop - start
+
+
+def make_lectures(unit):
+    """Insert a unit of lectures with their attendees and attendance taps.
+    Returns ({user index: [taps, first arrivals]}, taps inserted).
+    """
+    rng = random.Random(f"{_plan['seed']}:lectures:{unit}")
+    now = _plan['now']
+    counts, taps = {}, []
+    lectures = []
+    for spec in _plan['lectures'][unit * UNIT_SIZE:(unit + 1) * UNIT_SIZE]:
+        index, start, hours, room = spec
+        end = start + datetime.timedelta(hours=hours)
+        # Scale turnout so the whole term lands near the --taps target
+        turnout = max(1, round(_plan['taps_per_lecture'] * rng.uniform(0.6, 1.4)))
+        expected = int(turnout * rng.uniform(1.05, 1.5))
+        lecture_id = oid(KIND_LECTURE, index, start)
+        room_name, device_id = _plan['rooms'][room]
+        lecture = {
+            '_id': lecture_id,
+            'name': SUBJECTS[index % len(SUBJECTS)],
+            'professor': f'Dr. {LAST_NAMES[index % len(LAST_NAMES)]}',
+            'room': room_name,
+            'start_time': start,
+            'end_time': end,
+            'device_id': device_id,
+            'expected_students': expected,
+            'attendees': [],
+        }
+        if start <= now:
+            students = _pick_students(rng, turnout)
+            arrivals = []
+            for u in students:
+                if rng.random() < 0.9:
+                    offset = rng.gauss(-120, 240)  # most arrive just before the start
+                else:
+                    offset = rng.uniform(0, hours * 3600)  # late arrivals
+                when = start + datetime.timedelta(seconds=min(max(offset, -900), hours * 3600))
+                if when <= now:
+                    arrivals.append((when, u))
+            arrivals.sort()
+            lecture['attendees'] = [_user_oid(u) for _, u in arrivals]
+            context = f"{lecture['name']} — {room_name}"
+            for n, (when, u) in enumerate(arrivals):
+                c = counts.setdefault(u, [0, 0, 0])
+                c[0] += 1
+                if n == 0:
+                    c[2] += 1
+                taps.append({
+                    '_id': oid(KIND_TAP, index * 100000 + n, when),
+                    'user_id': _user_oid(u), 'user_name': user_name(u), 'device_id': device_id,
+                    'action': 'attendance', 'context': context, 'timestamp': when,
+                })
+        lectures.append(lecture)
+    _insert('lectures', lectures)
+    _insert('tap_events', taps)
+    return counts, len(taps)
+
+
+def make_events(unit):
+    """Insert a unit of society events with registrations, check-ins and taps."""
+    rng = random.Random(f"{_plan['seed']}:events:{unit}")
+    now = _plan['now']
+    counts, taps = {}, []
+    events = []
+    for spec in _plan['events'][unit * UNIT_SIZE:(unit + 1) * UNIT_SIZE]:
+        index, date, society, device = spec
+        soc_name, soc_members = _plan['societies'][society]
+        event_id = oid(KIND_EVENT, index, date)
+        device_id, location = _plan['event_devices'][device]
+        members = rng.sample(soc_members, min(len(soc_members), rng.randint(10, 150)))
+        registered = members[:max(1, int(len(members) * 0.7))]
+        event = {
+            '_id': event_id,
+            'society_id': oid(KIND_SOCIETY, society, _plan['term_start']),
+            'name': f'{soc_name} Meetup #{index}',
+            'description': '',
+            'location': location,
+            'date': date,
+            'capacity': max(50, len(members)),
+            'registered': [_user_oid(u) for u in registered],
+            'checked_in': [],
+            'device_id': device_id,
+        }
+        if date <= now:
+            arrivals = sorted(
+                (date + datetime.timedelta(seconds=min(max(rng.gauss(600, 900), -900), 7200)), u)
+                for u in members if rng.random() < 0.75
+            )
+            arrivals = [(when, u) for when, u in arrivals if when <= now]
+            event['checked_in'] = [_user_oid(u) for _, u in arrivals]
+            context = f"{event['name']} — {soc_name}"
+            for n, (when, u) in enumerate(arrivals):
+                counts.setdefault(u, [0, 0, 0])[1] += 1
+                taps.append({
+                    '_id': oid(KIND_TAP, 10 ** 12 + index * 100000 + n, when),
+                    'user_id': _user_oid(u), 'user_name': user_name(u), 'device_id': device_id,
+                    'action': 'event_checkin', 'context': context, 'timestamp': when,
+                })
+        events.append(event)
+    _insert('events', events)
+    _insert('tap_events', taps)
+    return counts, len(taps)
+
+
+# ─── Plan (main process) ─────────────────────────────
+
+def build_plan(args, password_hash):
+    """Everything the workers need, derived from --seed alone."""
+    rng = random.Random(f'{args.seed}:plan')
+    now = args.now
+    today = now.replace(hour=0, minute=0, second=0)
+    term_start = today - datetime.timedelta(days=args.days // 2)
+
+    rooms = [(f'{BUILDINGS[r % len(BUILDINGS)]} {r // len(BUILDINGS) + 1}.{r % 40 + 1:02d}', f'LT-{r:04d}')
+             for r in range(args.rooms)]
+
+    # Weekday hourly slots 09:00-17:00 per room, drawn without replacement
+    slots = [(day, hour, room)
+             for day in range(args.days)
+             if (term_start + datetime.timedelta(days=day)).weekday() < 5
+             for hour in range(9, 18) for room in range(args.rooms)]
+    chosen = sorted(rng.sample(slots, min(args.lectures, len(slots))))
+    lectures = []
+    for index, (day, hour, room) in enumerate(chosen):
+        start = term_start + datetime.timedelta(days=day, hours=hour)
+        lectures.append((index, start, rng.choice([1, 1, 1, 2]) if hour < 17 else 1, room))
+
+    societies = []
+    for s in range(args.societies):
+        size = min(args.users, int(rng.paretovariate(1.2) * 30))
+        societies.append((f'Society {s}', rng.sample(range(args.users), size)))
+
+    event_devices = [(f'EVT-{d:03d}', f'Event Space {d + 1}') for d in range(max(1, args.societies // 10))]
+    events = []
+    for index in range(args.events):
+        day = rng.randrange(args.days)
+        date = term_start + datetime.timedelta(days=day, hours=rng.choice([17, 18, 19, 20]))
+        events.append((index, date, rng.randrange(args.societies), rng.randrange(len(event_devices))))
+
+    # Event check-ins are whatever the society sizes give (see make_events);
+    # lectures make up the rest of the --taps target
+    expected_event_taps = sum(
+        0.75 * sum(min(len(societies[society][1]), k) for k in range(10, 151)) / 141
+        for _, date, society, _ in events if date <= now
+    )
+    past_lectures = sum(1 for _, start, _, _ in lectures if start <= now)
+    attendance_taps = max(0, args.taps - int(expected_event_taps))
+    return {
+        'seed': args.seed,
+        'now': now,
+        'term_start': term_start,
+        'users': args.users,
+        'password_hash': password_hash,
+        'rooms': rooms,
+        'lectures': lectures,
+        'societies': societies,
+        'event_devices': event_devices,
+        'events': events,
+        'taps_per_lecture': attendance_taps / max(1, past_lectures),
+    }
+
+
+def write_fixed(db, plan):
+    """Devices, societies and a little equipment: small enough for the main process."""
+    now = plan['now']
+    db.devices.insert_many(
+        [{'device_id': device_id, 'name': f'{room} reader', 'location': room, 'mode': 'attendance',
+          'config': {}, 'is_online': True, 'last_seen': now} for room, device_id in plan['rooms']]
+        + [{'device_id': device_id, 'name': location, 'location': location, 'mode': 'event',
+            'config': {}, 'is_online': True, 'last_seen': now} for device_id, location in plan['event_devices']]
+        + [{'device_id': f'EQ-{e:03d}', 'name': f'Equipment desk {e}', 'location': 'Maker Space', 'mode': 'equipment',
+            'config': {}, 'is_online': True, 'last_seen': now} for e in range(5)]
+    )
+    db.equipment.insert_many([
+        {'name': f'3D Printer #{e + 1}', 'location': 'Maker Space', 'device_id': f'EQ-{e % 5:03d}',
+         'status': 'available', 'current_user_id': None, 'queue': [], 'checkout_time': None}
+        for e in range(20)
+    ])
+    societies = []
+    for s, (name, members) in enumerate(plan['societies']):
+        member_ids = [oid(KIND_USER, u, plan['term_start']) for u in members]
+        societies.append({
+            '_id': oid(KIND_SOCIETY, s, plan['term_start']),
+            'name': name,
+            'lead_id': member_ids[0] if member_ids else None,
+            'admins': member_ids[:2],
+            'members': member_ids,
+            'description': '',
+        })
+    for i in range(0, len(societies), INSERT_BATCH):
+        db.societies.insert_many(societies[i:i + INSERT_BATCH], ordered=False)
+
+
+def apply_points(db, plan, counts):
+    """Points and first arrivals from the generated taps, in batches."""
+    ops = []
+    for u, (attended, checked_in, first) in counts.items():
+        ops.append(UpdateOne({'_id': oid(KIND_USER, u, plan['term_start'])}, {'$set': {
+            'points': attended * 10 + checked_in * 15 + first * 25,
+            'first_arrivals': first,
+            'badges': ['early_bird'] if first else [],
+        }}))
+        if len(ops) == INSERT_BATCH:
+            db.users.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        db.users.bulk_write(ops, ordered=False)
+
+
+def merge(total, counts):
+    for u, c in counts.items():
+        t = total.setdefault(u, [0, 0, 0])
+        t[0] += c[0]
+        t[1] += c[1]
+        t[2] += c[2]
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='unitap_large', help='target database (dropped first)')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--lectures', type=int, default=20000)
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--societies', type=int, default=300)
+    parser.add_argument('--rooms', type=int, default=120)
+    parser.add_argument('--taps', type=int, default=10000000, help='approximate tap_events to generate')
+    parser.add_argument('--days', type=int, default=70, help='term length in days, centred on today')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--now', type=datetime.datetime.fromisoformat,
+                        default=datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0),
+                        help='UTC moment the dataset is generated "as of" (default: start of this hour)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--skip-stats', action='store_true', help='do not rebuild daily_stats')
+    args = parser.parse_args()
+
+    uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
+    db = MongoClient(uri)[args.db]
+    for col in COLLECTIONS:
+        db[col].drop()
+
+    started = time.perf_counter()
+    # One shared hash: bcrypt per user would dominate the run. Password is demo123.
+    password_hash = bcrypt.hashpw(b'demo123', bcrypt.gensalt()).decode('utf-8')
+    plan = build_plan(args, password_hash)
+    write_fixed(db, plan)
+
+    counts, taps = {}, 0
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(uri, args.db, plan)) as pool:
+        users = sum(pool.map(make_users, range((args.users + INSERT_BATCH - 1) // INSERT_BATCH)))
+        print(f'{users} users')
+        for fn, n, label in ((make_lectures, len(plan['lectures']), 'lectures'),
+                             (make_events, len(plan['events']), 'events')):
+            for unit_counts, unit_taps in pool.map(fn, range((n + UNIT_SIZE - 1) // UNIT_SIZE)):
+                merge(counts, unit_counts)
+                taps += unit_taps
+            print(f'{n} {label}, {taps} taps so far ({time.perf_counter() - started:.0f}s)')
+
+    apply_points(db, plan, counts)
+    print('building indexes')
+    indexes.build(db)
+    print('building leaderboard counts')
+    leaderboard.rebuild(db)
+    if not args.skip_stats:
+        day = plan['term_start']
+        while day <= plan['now']:
+            daily_stats.rebuild(db, daily_stats.day_key(day))
+            day += datetime.timedelta(days=1)
+        daily_stats.rebuild_totals(db)
+    print(f'done: {args.users} users, {len(plan["lectures"])} lectures, {len(plan["events"])} events, '
+          f'{taps} taps into {args.db} in {time.perf_counter() - started:.0f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,472 @@
+"""Cross-worker fan-out for the live tap stream (/api/stream/taps).
+
+Each gunicorn worker only holds the SSE connections it accepted, so a tap
+handled by one worker has to reach dashboards connected to the others.
+publish() appends the event to the capped ``tap_stream`` collection with an
+unacknowledged insert. A reader thread in every process follows the
+collection with a tailable cursor and hands each event to that process's
+subscribers. The publishing worker also receives its own events through its
+reader, so every dashboard sees events in the same order, on any number of
+workers or hosts.
+
+A capped collection works on a standalone mongod, unlike change streams, and
+it drops old events by itself once it holds TAP_STREAM_MAX of them.
+
+An event is serialized once. publish() stores its JSON and gives it an id
+(the document _id). Each reader turns that into one immutable SSE frame,
+``id: ...\nevent: ...\ndata: ...\n\n`` as bytes, and every subscriber
+queue gets the same object.
+
+Each process also keeps the last TAP_STREAM_REPLAY frames in a ring buffer.
+When an EventSource reconnects, it sends the id of the last event it saw
+(Last-Event-ID), and subscribe() replays only the frames after it. If that id
+is no longer in the ring, the client gets a ``resync`` event and refetches.
+
+Subscriber queues hold at most TAP_STREAM_QUEUE frames, so a stalled browser
+tab cannot grow a worker's memory. When a queue is full, the
+TAP_STREAM_SLOW_POLICY applies:
+  disconnect (default) - end that client's stream. EventSource reconnects
+                         and catches up from the ring, or resyncs.
+  drop                 - drop the frame for that client only.
+
+Subscribers can ask for a subset of events with filters on TOPIC_FIELDS
+(for example action=attendance, or device_id=A,B). Values within a field are
+alternatives, and all given fields must match. Each event carries its topics,
+taken from its payload plus any extra ones given to publish(). Each filtered
+subscriber is indexed under one value of its most selective field. An event
+is therefore only checked against the unfiltered subscribers and the index
+entries for its own topic values, not against every connection.
+
+Tick mode (?mode=tick&tick=250) is for bursts, such as the start of a
+300-seat lecture. Events for that subscriber are collected and sent as one
+``batch`` frame per tick, holding the events and a count per action.
+TAP_STREAM_TICK_MAX caps the events waiting for one tick. A tick that would
+hold more becomes a resync.
+"""
+
+import collections
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from bson import ObjectId
+from pymongo import CursorType, WriteConcern
+from pymongo.errors import CollectionInvalid
+
+log = logging.getLogger(__name__)
+
+TAP_STREAM_SIZE_MB = int(os.getenv('TAP_STREAM_SIZE_MB', '16'))
+TAP_STREAM_MAX = int(os.getenv('TAP_STREAM_MAX', '50000'))
+TAP_STREAM_REPLAY = int(os.getenv('TAP_STREAM_REPLAY', '1024'))
+TAP_STREAM_QUEUE = int(os.getenv('TAP_STREAM_QUEUE', '256'))
+TAP_STREAM_SLOW_POLICY = os.getenv('TAP_STREAM_SLOW_POLICY', 'disconnect')
+TAP_STREAM_TICK_MS = int(os.getenv('TAP_STREAM_TICK_MS', '250'))
+TAP_STREAM_TICK_MAX = int(os.getenv('TAP_STREAM_TICK_MAX', '2000'))
+TICK_MS_RANGE = (50, 5000)
+TAP_STREAM_AWAIT_MS = 1000
+TAP_STREAM_RETRY = 0.1
+
+# ObjectIds from different publishers are not ordered within a second, so a
+# restarted cursor re-reads a short window and skips ids it already delivered
+_RESUME_OVERLAP = datetime.timedelta(seconds=2)
+_SEEN_SIZE = 4096
+
+# Most selective first: a subscriber is indexed under the first field it filters on
+TOPIC_FIELDS = ('user_id', 'device_id', 'lecture_id', 'society_id', 'action')
+
+_seen = collections.deque(maxlen=_SEEN_SIZE)
+_seen_ids = set()
+_listeners = []
+_thread = None
+_stats = {'published': 0, 'cursor_restarts': 0, 'errors': 0, 'batches': 0, 'tick_overflows': 0}
+
+RESYNC = b'event: resync\ndata: {}\n\n'
+
+# One delivered event: id as str, SSE event name, topics, payload JSON and its frame
+Event = collections.namedtuple('Event', 'id event topics json frame')
+
+
+def ensure_collection(db):
+    """Create the capped collection if it does not exist yet."""
+    try:
+        db.create_collection('tap_stream', capped=True, size=TAP_STREAM_SIZE_MB * 1024 * 1024, max=TAP_STREAM_MAX)
+    except CollectionInvalid:
+        pass
+
+
+def publish(db, data, event=None, topics=None):
+    """Send an event to subscribers in every worker. Costs the caller no round trip.
+    topics: filterable values not in the payload, e.g. {'lecture_id': ...}.
+    Returns the event id.
+    """
+    event_id = ObjectId()
+    all_topics = {f: str(data[f]) for f in TOPIC_FIELDS if data.get(f) is not None}
+    all_topics.update({f: str(v) for f, v in (topics or {}).items() if v is not None})
+    db.tap_stream.with_options(write_concern=WriteConcern(w=0)).insert_one({
+        '_id': event_id, 'event': event, 'topics': all_topics, 'json': json.dumps(data, separators=(',', ':')),
+    })
+    _stats['published'] += 1
+    return event_id
+
+
+def encode(event_id, event, payload):
+    """One SSE frame. payload is already-serialized JSON (never multi-line)."""
+    head = f'id: {event_id}\n'
+    if event:
+        head += f'event: {event}\n'
+    return f'{head}data: {payload}\n\n'.encode()
+
+
+# ─── Local subscribers ───────────────────────────────
+
+def parse_filters(params):
+    """Subscription filters from query parameters: {field: frozenset(values)}."""
+    filters = {}
+    for field in TOPIC_FIELDS:
+        values = {v.strip() for v in (params.get(field) or '').split(',') if v.strip()}
+        if values:
+            filters[field] = frozenset(values)
+    return filters
+
+
+def matches(filters, topics):
+    return all(topics.get(field) in values for field, values in filters.items())
+
+
+def tick_interval(params):
+    """Seconds per batch if the client asked for tick mode, else None."""
+    if params.get('mode') != 'tick':
+        return None
+    try:
+        ms = int(params.get('tick') or TAP_STREAM_TICK_MS)
+    except ValueError:
+        ms = TAP_STREAM_TICK_MS
+    return min(max(ms, TICK_MS_RANGE[0]), TICK_MS_RANGE[1]) / 1000
+
+
+class Subscriber:
+    """One SSE connection's bounded queue of frames.
+    get() raises queue.Empty on timeout and returns None once the stream should end.
+    """
+
+    filters = {}
+
+    def __init__(self, maxsize=TAP_STREAM_QUEUE):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def offer(self, event):
+        """Queue an Event without blocking. False if the queue is full."""
+        return self.push(event.frame)
+
+    def push(self, frame):
+        """Queue a raw frame (e.g. RESYNC) without blocking. False if full."""
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        """Discard pending frames and wake the reader with the end marker."""
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.push(None)
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+    def depth(self):
+        return self.queue.qsize()
+
+
+class Batch:
+    """Events waiting for a tick-mode subscriber's next tick."""
+
+    def __init__(self, max_events=TAP_STREAM_TICK_MAX):
+        self.lock = threading.Lock()
+        self.events = []
+        self.resync = False
+        self.max_events = max_events
+
+    def add(self, event):
+        """True if this is the first event of the tick."""
+        with self.lock:
+            first = not self.events and not self.resync
+            if self.resync:
+                return False
+            if len(self.events) >= self.max_events:
+                # Too much for one frame; the client refetches instead
+                self.events = []
+                self.resync = True
+                _stats['tick_overflows'] += 1
+                return False
+            self.events.append(event)
+            return first
+
+    def mark_resync(self):
+        with self.lock:
+            first = not self.events and not self.resync
+            self.events = []
+            self.resync = True
+            return first
+
+    def take(self):
+        """The tick's frame, or None if nothing arrived. Payloads are joined, not re-encoded."""
+        with self.lock:
+            events, resync = self.events, self.resync
+            self.events, self.resync = [], False
+        if resync:
+            return RESYNC
+        if not events:
+            return None
+        counts = collections.Counter(e.topics['action'] for e in events if not e.event and 'action' in e.topics)
+        items = ','.join(f'{{"event":{json.dumps(e.event)},"data":{e.json}}}' for e in events)
+        payload = f'{{"count":{len(events)},"counts":{json.dumps(counts)},"events":[{items}]}}'
+        _stats['batches'] += 1
+        return encode(events[-1].id, 'batch', payload)
+
+    def __len__(self):
+        return len(self.events)
+
+
+class TickSubscriber(Subscriber):
+    """A Subscriber that gets one batch frame per tick instead of one frame per event."""
+
+    def __init__(self, tick, max_events=TAP_STREAM_TICK_MAX):
+        self.tick = tick
+        self.batch = Batch(max_events)
+        self.ready = threading.Event()
+        self.closed = False
+        self.dropped = 0
+
+    def offer(self, event):
+        if self.batch.add(event):
+            self.ready.set()
+        return True
+
+    def push(self, frame):
+        # The only raw frame sent to subscribers is RESYNC
+        if self.batch.mark_resync():
+            self.ready.set()
+        return True
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def get(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            if not self.ready.wait(max(0.0, deadline - time.monotonic())):
+                raise queue.Empty
+            if self.closed:
+                return None
+            # Let the rest of the burst arrive, then send it as one frame
+            time.sleep(self.tick)
+            self.ready.clear()
+            frame = self.batch.take()
+            if frame is not None:
+                return frame
+
+    def depth(self):
+        return len(self.batch)
+
+
+def _anchor(filters):
+    """The index keys a filtered subscriber is stored under."""
+    field = next(f for f in TOPIC_FIELDS if f in filters)
+    return [(field, value) for value in filters[field]]
+
+
+class Channel:
+    """The subscribers to one stream in this process, with its replay ring and
+    subscription index. The tap stream is ``taps``; other modules can create
+    their own channels for events they compute locally (see leaderboard.py).
+    """
+
+    def __init__(self, name, replay=TAP_STREAM_REPLAY):
+        self.name = name
+        self._clients = set()
+        self._unfiltered = set()
+        self._index = {}  # (field, value) -> set of subscribers
+        self._lock = threading.Lock()
+        self._ring = collections.deque(maxlen=replay)  # Events
+        self._stats = {'delivered': 0, 'replayed': 0, 'resyncs': 0, 'dropped': 0, 'evicted': 0}
+
+    def _missed(self, last_event_id):
+        """Events after last_event_id, or None if it is no longer in the ring."""
+        missed = []
+        for event in reversed(self._ring):
+            if event.id == last_event_id:
+                missed.reverse()
+                return missed
+            missed.append(event)
+        return None
+
+    def subscribe(self, last_event_id=None, subscriber=None, filters=None):
+        """Register an SSE connection and return its Subscriber.
+        last_event_id: the reconnecting client's Last-Event-ID; what it missed is queued first.
+        filters: from parse_filters(); only matching events are delivered.
+        """
+        sub = subscriber or Subscriber()
+        sub.filters = filters or {}
+        with self._lock:
+            # Under the lock, so no event lands between the replay and live frames
+            if last_event_id:
+                missed = self._missed(last_event_id)
+                if missed is None or len(missed) >= TAP_STREAM_QUEUE:
+                    sub.push(RESYNC)
+                    self._stats['resyncs'] += 1
+                else:
+                    missed = [event for event in missed if matches(sub.filters, event.topics)]
+                    for event in missed:
+                        sub.offer(event)
+                    self._stats['replayed'] += len(missed)
+            self._clients.add(sub)
+            if not sub.filters:
+                self._unfiltered.add(sub)
+            else:
+                for key in _anchor(sub.filters):
+                    self._index.setdefault(key, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub not in self._clients:
+                return
+            self._clients.discard(sub)
+            self._unfiltered.discard(sub)
+            if sub.filters:
+                for key in _anchor(sub.filters):
+                    subs = self._index.get(key)
+                    if subs is not None:
+                        subs.discard(sub)
+                        if not subs:
+                            del self._index[key]
+
+    def _slow(self, sub):
+        """Apply the slow-consumer policy to a subscriber whose queue is full."""
+        if TAP_STREAM_SLOW_POLICY == 'drop':
+            sub.dropped += 1
+            self._stats['dropped'] += 1
+            return
+        self.unsubscribe(sub)
+        sub.close()
+        self._stats['evicted'] += 1
+
+    def deliver(self, event):
+        """Hand an Event to every matching subscriber."""
+        with self._lock:
+            self._ring.append(event)
+            targets = list(self._unfiltered)
+            for field, value in event.topics.items():
+                for sub in self._index.get((field, value), ()):
+                    if matches(sub.filters, event.topics):
+                        targets.append(sub)
+        for sub in targets:
+            if not sub.offer(event):
+                self._slow(sub)
+        self._stats['delivered'] += 1
+
+    def emit(self, event_id, data, event=None, topics=None):
+        """Encode and deliver an event that only this process's subscribers should see."""
+        payload = json.dumps(data, separators=(',', ':'))
+        self.deliver(Event(str(event_id), event, topics or {}, payload, encode(event_id, event, payload)))
+
+    def stats(self):
+        with self._lock:
+            depths = [sub.depth() for sub in self._clients]
+            unfiltered = len(self._unfiltered)
+            index_keys = len(self._index)
+        return {
+            **self._stats,
+            'subscribers': len(depths),
+            'queue_depth_max': max(depths, default=0),
+            'queue_depth_total': sum(depths),
+            'replay_buffer': len(self._ring),
+            'filtered_subscribers': len(depths) - unfiltered,
+            'index_keys': index_keys,
+        }
+
+
+taps = Channel('taps')
+subscribe = taps.subscribe
+unsubscribe = taps.unsubscribe
+
+
+def listen(callback):
+    """Call callback(event) in the reader thread for every tap stream event, after
+    subscribers have it. For in-process consumers that derive their own streams.
+    """
+    _listeners.append(callback)
+
+
+def _deliver(doc):
+    if doc['_id'] in _seen_ids:
+        return
+    if len(_seen) == _seen.maxlen:
+        _seen_ids.discard(_seen[0])
+    _seen.append(doc['_id'])
+    _seen_ids.add(doc['_id'])
+
+    event = Event(str(doc['_id']), doc.get('event'), doc.get('topics') or {}, doc['json'],
+                  encode(doc['_id'], doc.get('event'), doc['json']))
+    taps.deliver(event)
+    for callback in _listeners:
+        try:
+            callback(event)
+        except Exception:
+            _stats['errors'] += 1
+            log.exception('tap stream listener failed')
+
+
+# ─── Reader ──────────────────────────────────────────
+
+def _tail(db):
+    """Follow tap_stream from the moment the process started."""
+    resume_from = datetime.datetime.utcnow()
+    while True:
+        try:
+            query = {'_id': {'$gte': ObjectId.from_datetime(resume_from - _RESUME_OVERLAP)}}
+            cursor = db.tap_stream.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            cursor.max_await_time_ms(TAP_STREAM_AWAIT_MS)
+            while cursor.alive:
+                for doc in cursor:
+                    _deliver(doc)
+                    resume_from = max(resume_from, doc['_id'].generation_time.replace(tzinfo=None))
+            # Dead cursor: the collection was empty or we fell behind the cap
+            _stats['cursor_restarts'] += 1
+        except Exception:
+            _stats['errors'] += 1
+            log.exception('tap stream reader failed')
+        time.sleep(TAP_STREAM_RETRY)
+
+
+def start(db):
+    """Create the bus if needed and start this process's reader (once)."""
+    global _thread
+    if _thread is not None:
+        return
+    try:
+        ensure_collection(db)
+    except Exception:
+        _stats['errors'] += 1
+        log.exception('could not create tap_stream collection')
+    _thread = threading.Thread(target=_tail, args=(db,), name='tap-stream', daemon=True)
+    _thread.start()
+
+
+def stats():
+    return {
+        **_stats,
+        **taps.stats(),
+        'queue_size': TAP_STREAM_QUEUE,
+        'slow_policy': TAP_STREAM_SLOW_POLICY,
+    }
@@ -0,0 +1,278 @@
+"""Background worker for deferred tap side effects: XP, streaks and badges.
+
+The tap request only stores a job in the durable ``tap_jobs`` collection and
+answers with provisional points. A worker thread in each process claims
+pending jobs, coalesces all jobs for the same user into one pipeline update,
+and publishes each user's final points over SSE as a ``points`` event.
+
+Jobs are claimed with a lease (TAP_WORKER_LEASE seconds), so jobs held by a
+worker that died are picked up again by another. Processing is at-least-once:
+a crash between the user update and the job delete can apply a job twice.
+"""
+
+import datetime
+import logging
+import os
+import threading
+import time
+import uuid
+from pymongo import UpdateOne
+import cache
+import response_cache
+
+log = logging.getLogger(__name__)
+
+TAP_WORKER_ENABLED = os.getenv('TAP_WORKER_ENABLED', '1') == '1'
+TAP_WORKER_BATCH = int(os.getenv('TAP_WORKER_BATCH', '500'))
+TAP_WORKER_POLL = float(os.getenv('TAP_WORKER_POLL', '1'))
+TAP_WORKER_COALESCE_MS = float(os.getenv('TAP_WORKER_COALESCE_MS', '100'))
+TAP_WORKER_LEASE = float(os.getenv('TAP_WORKER_LEASE', '60'))
+
+_wake = threading.Event()
+_thread = None
+_stats = {'batches': 0, 'jobs': 0, 'users': 0, 'errors': 0, 'last_lag_ms': 0.0}
+
+TAP_POINTS = {
+    'attendance': 10,
+    'event_checkin': 15,
+    'equipment_checkout': 5,
+}
+FIRST_ARRIVAL_POINTS = 25
+
+# (streak length, badge, bonus XP)
+STREAK_BADGES = [
+    (3, 'streak_3', 20),
+    (7, 'streak_7', 50),
+    (30, 'streak_30', 200),
+]
+
+TOP10_FLOOR_TTL = 30
+_top10_floor_cache = cache.TTLCache(1, TOP10_FLOOR_TTL)
+
+
+def top10_floor(db):
+    """Points held by the 10th-ranked user, or None if there are fewer than 10 users.
+    Cached briefly so the top_10 badge check does not run a query per batch.
+    """
+    cached = _top10_floor_cache.get('floor')
+    if cached is None:
+        tenth = list(db.users.find({}, {'points': 1}).sort('points', -1).skip(9).limit(1))
+        cached = (tenth[0].get('points', 0) if tenth else None,)
+        _top10_floor_cache.set('floor', cached)
+    return cached[0]
+
+
+def gamification_pipeline(points, first_arrivals=0, attended=False, top10_floor=None):
+    """Build an update pipeline that awards XP, streaks and badges for one or
+    more taps by a single user.
+
+    points: base XP for the taps (TAP_POINTS plus first-arrival bonuses)
+    first_arrivals: number of attendance taps that were first arrivals
+    attended: whether any tap was an attendance (the streak moves once a day)
+    top10_floor: points of the 10th-ranked user, None if fewer than 10 users
+
+    Streak and badge rules are evaluated server-side against the stored
+    document, so the read-modify-write is one atomic round trip.
+    """
+    now = datetime.datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    yesterday = today - datetime.timedelta(days=1)
+    tomorrow = today + datetime.timedelta(days=1)
+    last = {'$ifNull': ['$last_attendance_date', None]}
+    badges = {'$ifNull': ['$badges', []]}
+
+    earned = []
+    bonus = []
+    pipeline = []
+
+    if first_arrivals:
+        earned.append(['early_bird'])
+
+    if attended:
+        # Streak — only update once per day
+        pipeline.append({'$set': {
+            '_new_day': {'$or': [{'$lt': [last, today]}, {'$gte': [last, tomorrow]}]},
+            '_streak': {'$cond': [
+                {'$and': [{'$gte': [last, yesterday]}, {'$lt': [last, today]}]},
+                {'$add': [{'$ifNull': ['$current_streak', 0]}, 1]},
+                1,
+            ]},
+        }})
+        pipeline.append({'$set': {
+            'last_attendance_date': {'$cond': ['$_new_day', now, '$last_attendance_date']},
+            'current_streak': {'$cond': ['$_new_day', '$_streak', '$current_streak']},
+            'best_streak': {'$cond': [
+                {'$and': ['$_new_day', {'$gt': ['$_streak', {'$ifNull': ['$best_streak', 0]}]}]},
+                '$_streak',
+                '$best_streak',
+            ]},
+        }})
+        for length, badge, extra in STREAK_BADGES:
+            unlocked = {'$and': [
+                '$_new_day',
+                {'$gte': ['$_streak', length]},
+                {'$eq': [{'$in': [badge, badges]}, False]},
+            ]}
+            earned.append({'$cond': [unlocked, [badge], []]})
+            bonus.append({'$cond': [unlocked, extra, 0]})
+
+    inc = {'points': {'$add': [{'$ifNull': ['$points', 0]}, points, *bonus]}}
+    if first_arrivals:
+        inc['first_arrivals'] = {'$add': [{'$ifNull': ['$first_arrivals', 0]}, first_arrivals]}
+    inc['_earned'] = {'$concatArrays': earned} if earned else []
+    pipeline.append({'$set': inc})
+
+    # Post-update: century + top_10 badges, judged on the new total
+    post = [{'$cond': [{'$gte': ['$points', 100]}, ['century'], []]}]
+    if top10_floor is None:
+        post.append(['top_10'])
+    else:
+        post.append({'$cond': [{'$gte': ['$points', top10_floor]}, ['top_10'], []]})
+    pipeline.append({'$set': {
+        'badges': {'$concatArrays': [badges, {'$filter': {
+            'input': {'$setUnion': [{'$concatArrays': ['$_earned', *post]}]},
+            'cond': {'$eq': [{'$in': ['$$this', badges]}, False]},
+        }}]},
+    }})
+    pipeline.append({'$project': {'_new_day': 0, '_streak': 0, '_earned': 0}})
+    return pipeline
+
+
+def award_society_star(db, user):
+    """Grant society_star once a user has checked into 5+ events."""
+    if 'society_star' in user.get('badges', []):
+        return
+    if db.events.count_documents({'checked_in': user['_id']}) >= 5:
+        db.users.update_one({'_id': user['_id']}, {'$addToSet': {'badges': 'society_star'}})
+
+
+def provisional_points(user, action, is_first_arrival=False):
+    """Points to show the reader straight away: the user's last known points
+    plus this tap's base XP. Streak bonuses arrive with the final points.
+    """
+    points = user.get('points', 0) + TAP_POINTS.get(action, 0)
+    if is_first_arrival and action == 'attendance':
+        points += FIRST_ARRIVAL_POINTS
+    return points
+
+
+def make_job(tap_event, is_first_arrival=False):
+    return {
+        'tap_id': tap_event['_id'],
+        'user_id': tap_event['user_id'],
+        'action': tap_event['action'],
+        'is_first_arrival': is_first_arrival,
+        'status': 'pending',
+        'created_at': datetime.datetime.utcnow(),
+    }
+
+
+def enqueue(db, jobs):
+    """Store jobs for the worker and wake this process's worker thread."""
+    jobs = [j for j in jobs if TAP_POINTS.get(j['action'])]
+    if not jobs:
+        return
+    if len(jobs) == 1:
+        db.tap_jobs.insert_one(jobs[0])
+    else:
+        db.tap_jobs.insert_many(jobs, ordered=False)
+    _wake.set()
+
+
+def _claim(db, limit):
+    """Claim up to limit pending (or abandoned) jobs for this worker."""
+    now = datetime.datetime.utcnow()
+    claimable = {'$or': [
+        {'status': 'pending'},
+        {'status': 'claimed', 'claimed_at': {'$lt': now - datetime.timedelta(seconds=TAP_WORKER_LEASE)}},
+    ]}
+    ids = [j['_id'] for j in db.tap_jobs.find(claimable, {'_id': 1}).sort('created_at', 1).limit(limit)]
+    if not ids:
+        return []
+    owner = uuid.uuid4().hex
+    db.tap_jobs.update_many(
+        {'_id': {'$in': ids}, **claimable},
+        {'$set': {'status': 'claimed', 'owner': owner, 'claimed_at': now}}
+    )
+    return list(db.tap_jobs.find({'_id': {'$in': ids}, 'owner': owner}))
+
+
+def run_once(db):
+    """Claim and apply one batch of jobs. Returns the number of jobs applied."""
+    jobs = _claim(db, TAP_WORKER_BATCH)
+    if not jobs:
+        return 0
+
+    per_user = {}
+    for job in jobs:
+        agg = per_user.setdefault(job['user_id'], {
+            'points': 0, 'first_arrivals': 0, 'attended': False, 'checked_in': False, 'tap_ids': [],
+        })
+        agg['points'] += TAP_POINTS.get(job['action'], 0)
+        agg['tap_ids'].append(str(job['tap_id']))
+        if job['action'] == 'attendance':
+            agg['attended'] = True
+            if job.get('is_first_arrival'):
+                agg['points'] += FIRST_ARRIVAL_POINTS
+                agg['first_arrivals'] += 1
+        elif job['action'] == 'event_checkin':
+            agg['checked_in'] = True
+
+    floor = top10_floor(db)
+    db.users.bulk_write([
+        UpdateOne({'_id': uid}, gamification_pipeline(
+            agg['points'], first_arrivals=agg['first_arrivals'],
+            attended=agg['attended'], top10_floor=floor,
+        ))
+        for uid, agg in per_user.items()
+    ], ordered=False)
+    db.tap_jobs.delete_many({'_id': {'$in': [j['_id'] for j in jobs]}})
+
+    users = {u['_id']: u for u in db.users.find({'_id': {'$in': list(per_user)}}, {'points': 1, 'badges': 1})}
+    from routes.tap import broadcast_tap
+    response_cache.invalidate(db)
+    for uid, agg in per_user.items():
+        user = users.get(uid)
+        if not user:
+            continue
+        if agg['checked_in']:
+            award_society_star(db, user)
+        broadcast_tap({
+            'user_id': str(uid),
+            'points': user.get('points', 0),
+            'tap_ids': agg['tap_ids'],
+        }, event='points', invalidate=False)
+
+    oldest = min(j['created_at'] for j in jobs)
+    _stats['batches'] += 1
+    _stats['jobs'] += len(jobs)
+    _stats['users'] += len(per_user)
+    _stats['last_lag_ms'] = round((datetime.datetime.utcnow() - oldest).total_seconds() * 1000, 1)
+    return len(jobs)
+
+
+def _loop(db):
+    while True:
+        _wake.wait(TAP_WORKER_POLL)
+        _wake.clear()
+        # Give a burst of taps a moment to pile up so they share one update
+        time.sleep(TAP_WORKER_COALESCE_MS / 1000)
+        try:
+            while run_once(db) >= TAP_WORKER_BATCH:
+                pass
+        except Exception:
+            _stats['errors'] += 1
+            log.exception('tap worker batch failed')
+
+
+def start(db):
+    """Start this process's worker thread (once)."""
+    global _thread
+    if not TAP_WORKER_ENABLED or _thread is not None:
+        return
+    _thread = threading.Thread(target=_loop, args=(db,), name='tap-worker', daemon=True)
+    _thread.start()
+
+
+def stats():
+    return {**_stats, 'running': _thread is not None and _thread.is_alive()}
@@ -0,0 +1,129 @@
+"""Optional group-commit write-behind for tap_events inserts.
+
+With TAP_WRITE_BEHIND=1, a tap request queues its document in memory and a
+flusher thread writes everything queued with one insert_many(ordered=False).
+A group is flushed once it reaches TAP_WRITE_BATCH documents or once its
+oldest document has waited TAP_WRITE_INTERVAL_MS. The request blocks until its
+group has committed, so the response still means "stored". Each tap waits a
+few extra milliseconds in exchange for far fewer inserts under burst load.
+Grouping only happens across concurrent requests in one process. Under
+uvicorn those are the taps running on the same worker's a2wsgi thread pool
+(WSGI_THREADS, see asgi.py) at once.
+
+With write-behind off (the default), insert() is a plain insert_one.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+log = logging.getLogger(__name__)
+
+TAP_WRITE_BEHIND = os.getenv('TAP_WRITE_BEHIND', '0') == '1'
+TAP_WRITE_BATCH = int(os.getenv('TAP_WRITE_BATCH', '256'))
+TAP_WRITE_INTERVAL_MS = float(os.getenv('TAP_WRITE_INTERVAL_MS', '5'))
+TAP_WRITE_TIMEOUT = float(os.getenv('TAP_WRITE_TIMEOUT', '30'))
+
+_cond = threading.Condition()
+_pending = []
+_thread = None
+_stats = {'inserts': 0, 'flushes': 0, 'max_batch': 0, 'errors': 0}
+# Recent per-document commit latencies (enqueue -> group committed), in ms
+_latencies = collections.deque(maxlen=1000)
+
+
+class _Pending:
+    __slots__ = ('doc', 'queued_at', 'done', 'error')
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.queued_at = time.monotonic()
+        self.done = threading.Event()
+        self.error = None
+
+
+def insert(db, doc):
+    """Insert a tap event and return its _id once it is committed.
+    Raises DuplicateKeyError like insert_one would.
+    """
+    if not TAP_WRITE_BEHIND or _thread is None:
+        return db.tap_events.insert_one(doc).inserted_id
+
+    pending = _Pending(doc)
+    with _cond:
+        _pending.append(pending)
+        _cond.notify()
+    if not pending.done.wait(TAP_WRITE_TIMEOUT):
+        raise OperationFailure('tap_events group commit timed out')
+    if pending.error is not None:
+        raise pending.error
+    return doc['_id']
+
+
+def _commit(db, group):
+    """Write one group and hand each waiting request its outcome."""
+    try:
+        db.tap_events.insert_many([p.doc for p in group], ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get('writeErrors', []):
+            exc = DuplicateKeyError if err.get('code') == 11000 else OperationFailure
+            group[err['index']].error = exc(err.get('errmsg', ''), err.get('code'), err)
+    except Exception as e:
+        _stats['errors'] += 1
+        log.exception('tap_events group commit failed')
+        for p in group:
+            p.error = e
+
+    now = time.monotonic()
+    _stats['flushes'] += 1
+    _stats['inserts'] += len(group)
+    _stats['max_batch'] = max(_stats['max_batch'], len(group))
+    for p in group:
+        _latencies.append((now - p.queued_at) * 1000)
+        p.done.set()
+
+
+def _loop(db):
+    interval = TAP_WRITE_INTERVAL_MS / 1000
+    while True:
+        with _cond:
+            while not _pending:
+                _cond.wait()
+            deadline = _pending[0].queued_at + interval
+            while len(_pending) < TAP_WRITE_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                _cond.wait(remaining)
+            group = _pending[:TAP_WRITE_BATCH]
+            del _pending[:TAP_WRITE_BATCH]
+        _commit(db, group)
+
+
+def start(db):
+    """Start this process's flusher thread (once) if write-behind is enabled."""
+    global _thread
+    if not TAP_WRITE_BEHIND or _thread is not None:
+        return
+    _thread = threading.Thread(target=_loop, args=(db,), name='tap-writer', daemon=True)
+    _thread.start()
+
+
+def stats():
+    latencies = sorted(_latencies)
+
+    def pct(p):
+        return round(latencies[int(p / 100 * (len(latencies) - 1))], 2) if latencies else 0.0
+
+    return {
+        **_stats,
+        'enabled': TAP_WRITE_BEHIND,
+        'batch_size': TAP_WRITE_BATCH,
+        'interval_ms': TAP_WRITE_INTERVAL_MS,
+        'queued': len(_pending),
+        'avg_batch': round(_stats['inserts'] / _stats['flushes'], 2) if _stats['flushes'] else 0.0,
+        'commit_ms': {'p50': pct(50), 'p95': pct(95), 'p99': pct(99)},
+    }
@@ -169,8 +169,18 @@ export const devices = {
 }
 
 // ─── SSE Stream ─────────────────────────────────────
-export function subscribeTapFeed(onEvent: (event: unknown) => void): () => void {
-  const source = new EventSource(`${BASE}/stream/taps`)
+// On reconnect the server replays missed events; onResync fires when it can't
+// (too far behind) and the caller should refetch. filters are matched server-side,
+// e.g. { action: 'attendance' } or { device_id: 'A,B' }.
+export type TapFeedFilters = Partial<Record<'action' | 'device_id' | 'lecture_id' | 'society_id' | 'user_id', string>>
+
+export function subscribeTapFeed(
+  onEvent: (event: unknown) => void,
+  onResync?: () => void,
+  filters?: TapFeedFilters,
+): () => void {
+  const query = filters ? new URLSearchParams(filters as Record<string, string>).toString() : ''
+  const source = new EventSource(`${BASE}/stream/taps${query ? `?${query}` : ''}`)
 
   source.onmessage = (e) => {
     try {
@@ -180,9 +190,70 @@ export function subscribeTapFeed(onEvent: (event: unknown) => void): () => void
     }
   }
 
+  source.addEventListener('resync', () => onResync?.())
+
   source.onerror = () => {
-    // EventSource auto-reconnects
+    // EventSource auto-reconnects, sending Last-Event-ID
   }
 
   return () => source.close()
 }
+
+// Tick mode: one 'batch' message per tick (ms) instead of one per tap, so a
+// burst of taps costs a handful of re-renders.
+export interface TapBatch {
+  count: number
+  counts: Record<string, number>
+  events: { event: string | null; data: unknown }[]
+}
+
+export function subscribeTapBatches(
+  onBatch: (batch: TapBatch) => void,
+  tickMs = 250,
+  onResync?: () => void,
+  filters?: TapFeedFilters,
+): () => void {
+  const query = new URLSearchParams({ ...(filters as Record<string, string>), mode: 'tick', tick: String(tickMs) })
+  const source = new EventSource(`${BASE}/stream/taps?${query}`)
+
+  source.addEventListener('batch', (e) => {
+    try {
+      onBatch(JSON.parse((e as MessageEvent).data))
+    } catch {
+      // ignore parse errors
+    }
+  })
+  source.addEventListener('resync', () => onResync?.())
+
+  return () => source.close()
+}
+
+// All-time leaderboard deltas: one 'delta' message per attendance tap, with the
+// tapping user's new standing. Everyone else on passed_taps taps drops one rank.
+export interface LeaderboardDelta {
+  user_id: string
+  name: string
+  taps: number
+  points: number
+  rank: number
+  prev_rank: number
+  passed_taps: number
+}
+
+export function subscribeLeaderboard(
+  onDelta: (delta: LeaderboardDelta) => void,
+  onResync?: () => void,
+): () => void {
+  const source = new EventSource(`${BASE}/stream/leaderboard`)
+
+  source.addEventListener('delta', (e) => {
+    try {
+      onDelta(JSON.parse((e as MessageEvent).data))
+    } catch {
+      // ignore parse errors
+    }
+  })
+  source.addEventListener('resync', () => onResync?.())
+
+  return () => source.close()
+}
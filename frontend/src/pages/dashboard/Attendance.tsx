@@ -42,7 +42,7 @@ export default function Attendance() {
     const unsubscribe = subscribeTapFeed((event) => {
       const tap = event as { action: string }
       if (tap.action === 'attendance') fetchLectures()
-    })
+    }, fetchLectures, { action: 'attendance' })
     return unsubscribe
   }, [fetchLectures])
 
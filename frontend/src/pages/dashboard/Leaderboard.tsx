@@ -1,12 +1,15 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { theme } from '../../styles/theme'
-import { gamification as gamificationApi, subscribeTapFeed } from '../../lib/api'
+import { gamification as gamificationApi, subscribeLeaderboard, subscribeTapBatches } from '../../lib/api'
 import { useAuth } from '../../lib/useAuth'
 import { useWindowSize } from '../../lib/useWindowSize'
 import type { LeaderboardEntry, LeaderboardResponse } from '../../types'
 
 const O = theme.colors
 
+// Rows returned by /api/gamification/leaderboard
+const TOP_N = 20
+
 // ─── Badge definitions ───────────────────────────────
 const BADGE_META: Record<string, { label: string; color: string }> = {
   early_bird:   { label: 'Early Bird',   color: O.warning },
@@ -191,6 +194,8 @@ export default function Leaderboard() {
   const [period, setPeriod] = useState<'all' | 'week'>('all')
   const [data, setData] = useState<LeaderboardResponse | null>(null)
   const [loading, setLoading] = useState(true)
+  const dataRef = useRef(data)
+  dataRef.current = data
 
   const fetchData = async () => {
     setLoading(true)
@@ -203,10 +208,36 @@ export default function Leaderboard() {
 
   useEffect(() => { fetchData() }, [period]) // eslint-disable-line react-hooks/exhaustive-deps
 
-  // Refresh on SSE tap events (points may change)
+  // All-time: apply each tap's delta locally. Weekly counts also age out, so
+  // that view refreshes at most once a second while taps arrive.
   useEffect(() => {
-    const unsub = subscribeTapFeed(() => { fetchData() })
-    return unsub
+    if (period === 'week') {
+      return subscribeTapBatches(() => { fetchData() }, 1000, fetchData)
+    }
+    return subscribeLeaderboard((delta) => {
+      const prev = dataRef.current
+      if (!prev) return
+      const board = prev.leaderboard
+      const entry = board.find(e => e._id === delta.user_id)
+      if (!entry && (board.length < TOP_N || delta.points > board[board.length - 1].points)) {
+        // New to the top list; its row needs the full profile
+        fetchData()
+        return
+      }
+      const leaderboard = entry
+        ? board
+            .map(e => e._id === delta.user_id ? { ...e, points: delta.points, weekly_taps: delta.taps } : e)
+            .sort((a, b) => b.points - a.points)
+            .map((e, i) => ({ ...e, rank: i + 1 }))
+        : board
+      let me = prev.me
+      if (me && me._id === delta.user_id) {
+        me = { ...me, points: delta.points, rank: delta.rank }
+      } else if (me && me.points / 10 === delta.passed_taps) {
+        me = { ...me, rank: me.rank + 1 }
+      }
+      setData({ leaderboard, me })
+    }, fetchData)
   }, [period]) // eslint-disable-line react-hooks/exhaustive-deps
 
   const board = data?.leaderboard ?? []
@@ -157,7 +157,7 @@ export default function Overview() {
       if (user && tapEvent.user_id === user._id && tapEvent.action === 'attendance') {
         fetchMyAttendance()
       }
-    })
+    }, fetchMyAttendance)
     return unsubscribe
   }, [user, isGlobalAdmin, fetchMyAttendance])
 